@@ -5,8 +5,10 @@ Get Profit/Loss data from Cloud Commerce Pro.
 """
 import logging
 
+from .cache import CacheWarmer, ProfitCache
 from .order_profit import OrderProfit
+from .store import ProfitStore
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-__all__ = ["OrderProfit"]
+__all__ = ["CacheWarmer", "OrderProfit", "ProfitCache", "ProfitStore"]
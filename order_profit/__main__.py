@@ -0,0 +1,5 @@
+"""Run the order_profit command."""
+
+from .cli import main
+
+main()
@@ -0,0 +1,214 @@
+"""Persistent cache of product data and exchange rates."""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ccapi import CCAPI
+
+from .concurrency import ccapi_limiter
+from .countries import countries
+from .product import Product
+
+logger = logging.getLogger("order_profit")
+
+
+class ProfitCache:
+    """
+    SQLite cache of product inventory data and currency exchange rates.
+
+    Entries older than ProfitCache.ttl seconds are ignored.
+
+    Attributes:
+        directory: The directory containing the cache database.
+        path: The path to the cache database.
+        ttl: The number of seconds for which cached entries are used.
+
+    """
+
+    FILENAME = "order_profit_cache.sqlite3"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            product_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            cached_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS rates (
+            currency_code TEXT PRIMARY KEY,
+            rate REAL NOT NULL,
+            cached_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, directory, ttl=86400):
+        """
+        Open the cache, creating it if it does not exist.
+
+        Args:
+            directory: The directory containing the cache database.
+            ttl: The number of seconds for which cached entries are used.
+
+        """
+        self.directory = str(directory)
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, self.FILENAME)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, timeout=60, check_same_thread=False
+        )
+        with self.lock, self.connection:
+            self.connection.executescript(self.SCHEMA)
+
+    def close(self):
+        """Close the connection to the cache database."""
+        self.connection.close()
+
+    def get(self, table, key_column, value_column, key):
+        """Return a cached value or None if it is missing or expired."""
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {value_column} FROM {table} "
+                f"WHERE {key_column} = ? AND cached_at >= ?",
+                (str(key), time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set(self, table, key_column, value_column, key, value):
+        """Add a value to the cache."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {table} "
+                f"({key_column}, {value_column}, cached_at) VALUES (?, ?, ?)",
+                (str(key), value, time.time()),
+            )
+
+    def get_product(self, product_id):
+        """Return cached product data as a dict or None."""
+        data = self.get("products", "product_id", "data", product_id)
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def set_product(self, product_id, product_data):
+        """Add product data to the cache."""
+        self.set("products", "product_id", "data", product_id, json.dumps(product_data))
+
+    def has_product(self, product_id):
+        """Return True if current data for a product is cached."""
+        return self.get("products", "product_id", "data", product_id) is not None
+
+    def get_rate(self, currency_code):
+        """Return the cached exchange rate to GBP for a currency or None."""
+        return self.get("rates", "currency_code", "rate", currency_code)
+
+    def set_rate(self, currency_code, rate):
+        """Add the exchange rate to GBP for a currency to the cache."""
+        self.set("rates", "currency_code", "rate", currency_code, rate)
+
+
+class CacheWarmer:
+    """
+    Fill a ProfitCache for orders which have not yet been dispatched.
+
+    Run this regularly during quiet periods, for example from cron, so
+    that the products in an OrderProfit run are already cached when the
+    orders are dispatched.
+
+    Attributes:
+        cache: The order_profit.cache.ProfitCache to fill.
+        number_of_days: The number of days of pending orders to check.
+        workers: The number of threads used to request products.
+        products: Dict of product IDs to loaded inventory products.
+        deadline: Always None, the warmer runs until it finishes.
+
+    """
+
+    number_of_days = 7
+    workers = 4
+    deadline = None
+
+    def __init__(self, cache, number_of_days=None, workers=None):
+        """
+        Create a cache warmer.
+
+        Args:
+            cache: The order_profit.cache.ProfitCache to fill.
+            number_of_days: The number of days of pending orders to check.
+            workers: The number of threads used to request products.
+
+        """
+        self.cache = cache
+        if number_of_days is not None:
+            self.number_of_days = number_of_days
+        if workers is not None:
+            self.workers = workers
+        self.products = {}
+
+    def get_orders(self):
+        """Return orders awaiting dispatch from Cloud Commerce."""
+        return ccapi_limiter.call(
+            CCAPI.get_orders_for_dispatch,
+            order_type=0,
+            number_of_days=self.number_of_days,
+        )
+
+    def run(self):
+        """
+        Cache the products and exchange rates for orders awaiting dispatch.
+
+        Returns:
+            Dict containing the number of products found, products cached
+            and products which could not be cached.
+
+        """
+        orders = self.get_orders()
+        countries.set_cache(self.cache)
+        for country_code in set(order.delivery_country_code for order in orders):
+            try:
+                countries[country_code].currency_rate
+            except Exception as e:
+                logger.exception(e)
+        order_products = {}
+        for order in orders:
+            for product in order.products:
+                order_products[product.product_id] = product
+        uncached = [
+            product
+            for product_id, product in order_products.items()
+            if not self.cache.has_product(product_id)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.warm_product, uncached))
+        print(
+            f"Cached {sum(results)} of {len(uncached)} uncached products.",
+            file=sys.stderr,
+        )
+        return {
+            "products": len(order_products),
+            "cached": sum(results),
+            "failed": len(uncached) - sum(results),
+        }
+
+    def warm_product(self, order_product):
+        """
+        Load a product's data into the cache.
+
+        Returns:
+            True if the product was cached.
+
+        """
+        try:
+            Product(self, order_product)
+        except Exception as e:
+            logger.exception(e)
+            return False
+        return True
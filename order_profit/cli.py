@@ -0,0 +1,265 @@
+"""Command line interface for Order Profit."""
+
+import argparse
+import cProfile
+import csv
+import datetime
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from .cache import ProfitCache
+from .concurrency import ccapi_limiter
+from .order_profit import OrderProfit
+from .store import ProfitStore
+
+
+def date(value):
+    """Return a datetime.date from an ISO 8601 date string."""
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value}")
+
+
+def get_parser():
+    """Return the argument parser for the order_profit command."""
+    parser = argparse.ArgumentParser(
+        prog="order_profit",
+        description="Write Profit/Loss data for dispatched Cloud Commerce orders.",
+    )
+    dates = parser.add_argument_group("date range")
+    dates.add_argument("--start", type=date, help="first dispatch date, YYYY-MM-DD")
+    dates.add_argument(
+        "--end", type=date, help="day after the last dispatch date, YYYY-MM-DD"
+    )
+    dates.add_argument(
+        "--days",
+        type=int,
+        default=OrderProfit.number_of_days,
+        help="number of days of orders to load if --start is not given",
+    )
+    performance = parser.add_argument_group("performance")
+    performance.add_argument(
+        "--workers",
+        type=int,
+        default=OrderProfit.workers,
+        help="number of threads requesting products (default: --concurrency)",
+    )
+    performance.add_argument(
+        "--concurrency",
+        type=int,
+        default=ccapi_limiter.maximum,
+        help="maximum concurrent Cloud Commerce requests",
+    )
+    performance.add_argument(
+        "--cache-dir", help="directory of the product and exchange rate cache"
+    )
+    performance.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=86400,
+        help="seconds for which cached data is used",
+    )
+    performance.add_argument(
+        "--time-limit", type=float, help="stop pricing orders after this many seconds"
+    )
+    performance.add_argument(
+        "--sample-size",
+        type=int,
+        help=(
+            "price a stratified sample of this many orders; strata too small "
+            "for two sampled orders are pooled, so a small sample may not be "
+            "stratified at all"
+        ),
+    )
+    performance.add_argument(
+        "--seed", type=int, help="random seed for --sample-size, to repeat a sample"
+    )
+    output = parser.add_argument_group("output")
+    output.add_argument(
+        "--format", choices=("csv", "json"), default="csv", help="output format"
+    )
+    output.add_argument(
+        "--output", "-o", help="file to write results to, defaults to stdout"
+    )
+    output.add_argument("--store", help="ProfitStore database to add results to")
+    output.add_argument(
+        "--progress", action="store_true", help="print each order as it is priced"
+    )
+    output.add_argument(
+        "--stats",
+        action="store_true",
+        help="print coverage, request and timing statistics to stderr",
+    )
+    output.add_argument(
+        "--profile",
+        metavar="DIRECTORY",
+        help=(
+            "save cProfile and tracemalloc reports for each stage; cProfile "
+            "only covers the main thread, so product requests made by worker "
+            "threads appear as time waiting for them"
+        ),
+    )
+    return parser
+
+
+class Writer:
+    """Stream order rows to a file as CSV or JSON lines."""
+
+    def __init__(self, file, output_format):
+        """
+        Create a writer.
+
+        Args:
+            file: The file object to write to.
+            output_format: "csv" or "json".
+
+        """
+        self.file = file
+        self.output_format = output_format
+        if self.output_format == "csv":
+            self.writer = csv.DictWriter(
+                self.file, fieldnames=ProfitStore.ORDER_COLUMNS
+            )
+            self.writer.writeheader()
+
+    def write(self, order):
+        """Write an order."""
+        row = ProfitStore.order_row(order)
+        if self.output_format == "csv":
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+
+
+@contextmanager
+def stage(name, stats, profile_directory=None):
+    """
+    Time a stage, optionally saving cProfile and tracemalloc reports.
+
+    cProfile only profiles the calling thread, so work done in thread pools,
+    such as requesting products, is not included in the cProfile report.
+    tracemalloc traces allocations from every thread.
+
+    Args:
+        name: The name of the stage.
+        stats: Dict to which the stage's duration is added.
+        profile_directory: Directory in which reports are saved, or None.
+
+    """
+    profiler = None
+    if profile_directory is not None:
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats[name] = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            save_profile(name, profile_directory, profiler, snapshot, peak)
+
+
+def save_profile(name, directory, profiler, snapshot, peak):
+    """Save the cProfile and tracemalloc reports for a stage."""
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.txt"), "w") as report:
+        report.write(f"Stage: {name}\nPeak traced memory: {peak} bytes\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+        report.write("\nLargest allocations by line:\n")
+        for statistic in snapshot.statistics("lineno")[:25]:
+            report.write(f"{statistic}\n")
+
+
+def print_stats(order_profit, stats):
+    """Print statistics for a run to stderr."""
+    for name, duration in stats.items():
+        print(f"{name}: {duration:.2f}s", file=sys.stderr)
+    print(f"Coverage: {order_profit.coverage}", file=sys.stderr)
+    for reason, count in order_profit.coverage.reasons().items():
+        print(f"    {reason}: {count}", file=sys.stderr)
+    print(f"Cloud Commerce requests: {ccapi_limiter.metrics()}", file=sys.stderr)
+    if order_profit.sample is not None:
+        print(
+            f"Sample: {order_profit.sample.size} orders in "
+            f"{len(order_profit.sample.strata)} strata",
+            file=sys.stderr,
+        )
+    if order_profit.estimate is not None:
+        print(f"Estimated profit: {order_profit.estimate.profit}", file=sys.stderr)
+        print(f"Estimated margin: {order_profit.estimate.margin}", file=sys.stderr)
+
+
+def run(args, file):
+    """Run Order Profit with parsed arguments, writing results to file."""
+    ccapi_limiter.maximum = args.concurrency
+    ccapi_limiter.limit = min(ccapi_limiter.limit, float(args.concurrency))
+    cache = None
+    if args.cache_dir is not None:
+        cache = ProfitCache(args.cache_dir, ttl=args.cache_ttl)
+    order_profit = OrderProfit(
+        start=args.start,
+        end=args.end,
+        workers=args.workers,
+        cache=cache,
+        time_limit=args.time_limit,
+        sample_size=args.sample_size,
+        seed=args.seed,
+        progress=args.progress,
+        run=False,
+    )
+    if args.start is None:
+        order_profit.number_of_days = args.days
+    order_profit.coverage.keep_orders = args.sample_size is not None
+    store = None
+    if args.store is not None:
+        store = ProfitStore(args.store)
+    writer = Writer(file, args.format)
+    stats = {}
+    with stage("load", stats, args.profile):
+        order_profit.load_orders()
+    with stage("select", stats, args.profile):
+        orders = order_profit.select_orders()
+    # Release the loaded orders so each is freed once it has been written.
+    order_profit.orders = []
+    order_profit.valid_orders = []
+    order_profit.invalid_orders = []
+    order_profit.index = None
+    with stage("price", stats, args.profile):
+        priced_orders = order_profit.price_orders(orders)
+        del orders
+        for order in priced_orders:
+            writer.write(order)
+            if store is not None:
+                with store.connection:
+                    store.add_order(order)
+    if order_profit.sample is not None:
+        order_profit.estimate = order_profit.sample.estimate(
+            order_profit.coverage.completed
+        )
+    if store is not None:
+        store.close()
+    if args.stats is True:
+        print_stats(order_profit, stats)
+    return order_profit
+
+
+def main(argv=None):
+    """Run the order_profit command."""
+    args = get_parser().parse_args(argv)
+    if args.output is None:
+        run(args, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as file:
+            run(args, file)
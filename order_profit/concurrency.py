@@ -0,0 +1,266 @@
+"""Adaptive concurrency limiting for Cloud Commerce API requests."""
+
+import threading
+import time
+
+from . import exceptions
+
+
+class AdaptiveLimiter:
+    """
+    Limit the number of concurrent requests using AIMD.
+
+    The limit increases additively, by roughly one request per limit
+    successful requests, while requests succeed within the latency
+    target and the limit is in use. Requests made while fewer than limit
+    requests are running do not increase it, so the limit does not grow
+    beyond the concurrency callers actually reach. It decreases
+    multiplicatively when a request fails or is slower than the latency
+    target. At most one decrease is made per average request latency so a
+    burst of failures from one window of requests does not collapse the
+    limit.
+
+    Latency is tracked separately for each endpoint, the function called,
+    as different requests take very different times. A request is slow if
+    its endpoint's smoothed latency exceeds the latency target or, if no
+    target is given, AdaptiveLimiter.LATENCY_TOLERANCE times the
+    endpoint's baseline latency. The baseline is a slowly decaying average
+    of the endpoint's successful requests, so single slow requests and
+    normal jitter do not count as throttling. No endpoint is slow until it
+    has made AdaptiveLimiter.WARM_UP requests.
+
+    Attributes:
+        limit: The current number of requests allowed at once.
+        minimum: The lowest limit allowed.
+        maximum: The highest limit allowed.
+        backoff: The factor by which the limit is multiplied on decrease.
+        latency_target: Smoothed latencies above this number of seconds
+            are treated as a sign of throttling. If None each endpoint's
+            baseline latency is used.
+        in_flight: The number of requests currently running.
+        latency: The exponentially weighted average request latency in
+            seconds.
+        endpoints: Dict of endpoint names to
+            order_profit.concurrency.EndpointLatency.
+        requests: The number of requests made.
+        errors: The number of requests which raised an exception.
+
+    """
+
+    SMOOTHING = 0.2
+    WARM_UP = 10
+    LATENCY_TOLERANCE = 2
+
+    def __init__(
+        self, initial=4, minimum=1, maximum=32, backoff=0.5, latency_target=None
+    ):
+        """
+        Create a limiter.
+
+        Args:
+            initial: The initial number of requests allowed at once.
+            minimum: The lowest limit allowed.
+            maximum: The highest limit allowed.
+            backoff: The factor by which the limit is multiplied on decrease.
+            latency_target: Smoothed latencies above this number of seconds
+                are treated as a sign of throttling. If None each endpoint's
+                baseline latency is used.
+
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.latency = None
+        self.endpoints = {}
+        self.requests = 0
+        self.errors = 0
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self, timeout=None):
+        """
+        Wait until a request can be made within the current limit.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait
+                until the request can be made.
+
+        Returns:
+            True if the request can be made, False if the timeout passed.
+
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        """Mark a request as finished."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func within the limit and adjust the limit from the outcome.
+
+        Exceptions raised by func are recorded as errors and re-raised.
+
+        """
+        return self.call_until(None, func, *args, **kwargs)
+
+    def call_until(self, deadline, func, *args, **kwargs):
+        """
+        Call func within the limit unless the deadline passes first.
+
+        The deadline is checked while waiting for the limit and again once
+        the request is allowed, so no request is started after it.
+
+        Args:
+            deadline: The time.monotonic() time after which func is not
+                called, or None.
+
+        Raises:
+            order_profit.exceptions.LimiterTimeout: If func could not be
+                called before the deadline.
+
+        """
+        endpoint = getattr(func, "__qualname__", repr(func))
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if self.acquire(timeout=timeout) is not True:
+            raise exceptions.LimiterTimeout(endpoint)
+        try:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise exceptions.LimiterTimeout(endpoint)
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self.record(time.monotonic() - start, error=True, endpoint=endpoint)
+                raise
+            self.record(time.monotonic() - start, endpoint=endpoint)
+            return result
+        finally:
+            self.release()
+
+    def record(self, latency, error=False, endpoint=None):
+        """
+        Adjust the limit from the outcome of a request.
+
+        Args:
+            latency: The time taken by the request in seconds.
+            error: True if the request failed.
+            endpoint: The name of the endpoint requested.
+
+        """
+        with self.condition:
+            self.requests += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.SMOOTHING * (latency - self.latency)
+            if error:
+                self.errors += 1
+                self.decrease()
+            elif self.slow(endpoint, latency):
+                self.decrease()
+            elif self.in_flight >= int(self.limit):
+                self.limit = min(self.limit + 1 / self.limit, float(self.maximum))
+            self.condition.notify_all()
+
+    def slow(self, endpoint, latency):
+        """Record a successful request and return True if it is slow."""
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointLatency(self.SMOOTHING)
+        endpoint_latency = self.endpoints[endpoint]
+        endpoint_latency.add(latency)
+        if endpoint_latency.requests < self.WARM_UP:
+            return False
+        if self.latency_target is not None:
+            return endpoint_latency.average > self.latency_target
+        return endpoint_latency.average > (
+            endpoint_latency.baseline * self.LATENCY_TOLERANCE
+        )
+
+    def decrease(self):
+        """Multiplicatively decrease the limit, at most once per latency."""
+        now = time.monotonic()
+        if now - self.last_decrease < (self.latency or 0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.limit * self.backoff, float(self.minimum))
+
+    def metrics(self):
+        """Return dict of the limiter's current state."""
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency": self.latency,
+                "baselines": {
+                    endpoint: endpoint_latency.baseline
+                    for endpoint, endpoint_latency in self.endpoints.items()
+                },
+                "requests": self.requests,
+                "errors": self.errors,
+            }
+
+
+class EndpointLatency:
+    """
+    Smoothed and baseline latency of successful requests to one endpoint.
+
+    Both are exponentially weighted averages. The baseline decays much more
+    slowly, so it reflects the endpoint's normal latency while the smoothed
+    average follows recent requests. Until enough requests have been made
+    for the weighting to apply both are plain averages.
+
+    Attributes:
+        average: The smoothed latency in seconds.
+        baseline: The baseline latency in seconds.
+        requests: The number of requests recorded.
+
+    """
+
+    BASELINE_SMOOTHING = 0.01
+
+    def __init__(self, smoothing):
+        """
+        Create an empty record.
+
+        Args:
+            smoothing: The weight of each request in the smoothed average.
+
+        """
+        self.smoothing = smoothing
+        self.average = 0
+        self.baseline = 0
+        self.requests = 0
+
+    def add(self, latency):
+        """Add the latency of a successful request."""
+        self.requests += 1
+        self.average += max(self.smoothing, 1 / self.requests) * (
+            latency - self.average
+        )
+        self.baseline += max(self.BASELINE_SMOOTHING, 1 / self.requests) * (
+            latency - self.baseline
+        )
+
+
+ccapi_limiter = AdaptiveLimiter()
@@ -27,6 +27,17 @@ class Countries:
         country_list = [Country(row) for row in self.table]
         self.countries = {int(country.id): country for country in country_list}
 
+    def set_cache(self, cache):
+        """
+        Use a cache for currency exchange rates.
+
+        Args:
+            cache: order_profit.cache.ProfitCache or None to disable caching.
+
+        """
+        for country in self:
+            country.cache = cache
+
     def get_table(self):
         """Return tabler.Table object containing country information."""
         return Table(self.get_table_path(), table_type=CSV())
@@ -63,6 +74,8 @@ class Country:
             in this country.
         services: Dict of shipping services available to this country as
             order_profit.countries.Service objects.
+        cache: order_profit.cache.ProfitCache used for exchange rates, or
+            None.
 
     """
 
@@ -71,6 +84,7 @@ class Country:
     SERVICE_CODES = ("PAK", "PAT", "PAR", "PAP", "SMIU", "SMIT")
 
     _currency_rate = None
+    cache = None
 
     def __init__(self, row):
         """
@@ -127,8 +141,14 @@ class Country:
         """Return current currency conversion rate to GBP."""
         if self.currency_code == "GBP":
             return 1
-        rates = self.get_exchange_rates()
-        return rates["GBP"]
+        if self.cache is not None:
+            rate = self.cache.get_rate(self.currency_code)
+            if rate is not None:
+                return rate
+        rate = self.get_exchange_rates()["GBP"]
+        if self.cache is not None:
+            self.cache.set_rate(self.currency_code, rate)
+        return rate
 
 
 class Service:
@@ -0,0 +1,70 @@
+"""Reporting which orders an Order Profit run was able to price."""
+
+
+class CoverageReport:
+    """
+    Record of the orders priced, and skipped, by an OrderProfit run.
+
+    Attributes:
+        completed: List of order_profit.order.Order priced successfully, if
+            keep_orders is True.
+        completed_count: The number of orders priced successfully.
+        skipped: Dict of order IDs of skipped orders to the reason each
+            was skipped.
+        deadline_exceeded: True if the run stopped at its deadline.
+        keep_orders: If False completed orders are counted but not kept.
+
+    """
+
+    INVALID = "Failed validation: {}"
+    INVALID_SERVICE = "Sent with an invalid shipping service"
+    DEADLINE = "Deadline exceeded"
+    PRODUCTS_NOT_LOADED = "Products could not be loaded"
+    ERROR = "Profit could not be calculated"
+    NOT_SAMPLED = "Not included in sample"
+
+    def __init__(self, keep_orders=True):
+        """
+        Create an empty report.
+
+        Args:
+            keep_orders: If False completed orders are counted but not kept,
+                so they can be released once they have been used.
+
+        """
+        self.completed = []
+        self.completed_count = 0
+        self.skipped = {}
+        self.deadline_exceeded = False
+        self.keep_orders = keep_orders
+
+    def __repr__(self):
+        return (
+            f"{self.completed_count} orders completed, "
+            f"{len(self.skipped)} skipped ({self.coverage:.0%} coverage)"
+        )
+
+    def complete(self, order):
+        """Record an order as priced."""
+        self.completed_count += 1
+        if self.keep_orders is True:
+            self.completed.append(order)
+
+    def skip(self, order, reason):
+        """Record an order as skipped."""
+        self.skipped[order.order_id] = reason
+
+    @property
+    def coverage(self):
+        """Return the proportion of orders which were priced."""
+        total = self.completed_count + len(self.skipped)
+        if total == 0:
+            return 1
+        return self.completed_count / total
+
+    def reasons(self):
+        """Return dict of reasons orders were skipped to number of orders."""
+        reasons = {}
+        for reason in self.skipped.values():
+            reasons[reason] = reasons.get(reason, 0) + 1
+        return reasons
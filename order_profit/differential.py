@@ -0,0 +1,723 @@
+"""
+Differential testing of fast paths against the reference order calculation.
+
+Generates random populations of orders covering every country, shipping
+service and shipping rule, and checks that each fast path produces the
+same results as a straightforward, per-order reference implementation of
+the Profit/Loss calculation. No requests are made to Cloud Commerce or
+the exchange rate API.
+
+Run with:
+
+    python -m order_profit.differential --size 10000 --seed 1
+
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from . import exceptions, shipping
+from .cache import ProfitCache
+from .countries import countries
+from .index import ProfitIndex
+from .order import Order
+from .order_profit import OrderProfit
+from .product import Product
+
+FIELDS = (
+    "courier",
+    "department",
+    "weight",
+    "item_count",
+    "vat_rate",
+    "purchase_price",
+    "postage_price",
+    "channel_fee",
+    "profit",
+    "vat",
+    "profit_vat",
+)
+
+
+class Harness:
+    """
+    Test data and shared state for a differential test run.
+
+    The harness is passed in place of an OrderProfit to Order and Product,
+    which load inventory products from Harness.products.
+
+    Attributes:
+        seed: The seed used to generate the test data.
+        size: The number of randomly drawn orders in the population.
+        courier_rules: Fake Cloud Commerce courier rules, one for every
+            shipping rule ID.
+        shipping_rules: order_profit.shipping.ShippingRules.
+        products: Dict of product IDs to fake inventory products.
+        population: List of fake Cloud Commerce dispatch orders. The
+            population starts with one order for every pair of shipping
+            rule and country, followed by Harness.size random orders.
+        currency_rates: Dict of currency codes to fake exchange rates.
+        cache: Always None, product data is not cached.
+        deadline: Always None.
+        product_cache: order_profit.cache.ProfitCache containing the data
+            for every inventory product while open, or None.
+
+    """
+
+    VAT_RATES = ("0", "5", "20")
+    DEPARTMENTS = ("Beauty", "Garden", "Toys", "Homeware")
+    UNKNOWN_COUNTRY_ID = 999999
+    UNKNOWN_RULE_ID = 999999
+
+    cache = None
+    deadline = None
+
+    def __init__(self, size=1000, seed=0):
+        """
+        Generate test data.
+
+        Args:
+            size: The number of random orders in the population, in
+                addition to the orders covering every shipping rule and
+                country.
+            seed: The seed used to generate the test data.
+
+        """
+        self.seed = seed
+        self.size = size
+        self.random = random.Random(seed)
+        self.shipping_rules = shipping.ShippingRules()
+        rule_ids = sorted(
+            set(
+                rule_id
+                for cls in shipping.all_subclasses(shipping.ShippingRule)
+                for rule_id in cls.rule_ids or []
+            )
+        )
+        self.courier_rules = [
+            SimpleNamespace(id=rule_id, name=self.courier_rule_name(rule_id))
+            for rule_id in rule_ids
+        ]
+        self.currency_rates = {
+            country.currency_code: round(self.random.uniform(0.5, 1.5), 4)
+            for country in countries
+            if country.currency_code not in (None, "GBP")
+        }
+        self.products = {
+            product_id: self.inventory_product(product_id)
+            for product_id in range(1, 201)
+        }
+        self.population = [
+            self.dispatch_order(number, country_id, rule_id)
+            for number, (country_id, rule_id) in enumerate(self.coverage())
+        ]
+        self.population.extend(
+            self.dispatch_order(number, *self.destination())
+            for number in range(len(self.population), len(self.population) + size)
+        )
+        self.product_cache = None
+
+    @staticmethod
+    def courier_rule_name(rule_id):
+        """Return the fake courier rule name for a shipping rule ID."""
+        return f"Rule {rule_id}"
+
+    def inventory_product(self, product_id):
+        """Return a fake ccapi.inventory_items.Product."""
+
+        def option(value):
+            return SimpleNamespace(value=SimpleNamespace(value=value))
+
+        return SimpleNamespace(
+            id=product_id,
+            range_id=f"R{product_id % 40}",
+            full_name=f"Product {product_id}",
+            vat_rate=self.random.choice(self.VAT_RATES),
+            options={
+                "Department": option(self.random.choice(self.DEPARTMENTS)),
+                "Purchase Price": option(f"{self.random.uniform(0, 30):.2f}"),
+            },
+        )
+
+    def order_product(self):
+        """Return a fake product from a Cloud Commerce order."""
+        product_id = self.random.choice(list(self.products))
+        return SimpleNamespace(
+            product_id=product_id,
+            sku=f"SKU-{product_id}",
+            quantity=self.random.choice((1, 1, 1, 2, 3, 10)),
+            per_item_weight=self.random.randint(0, 5000),
+        )
+
+    def coverage(self):
+        """
+        Return (country ID, rule ID) pairs covering every rule and country.
+
+        Every shipping rule is paired with every country, whether or not
+        the rule applies to it, cycling through the rule's Cloud Commerce
+        rule IDs.
+
+        """
+        pairs = []
+        for rule in self.shipping_rules.shipping_rules:
+            rule_ids = rule.rule_ids or [c.id for c in self.courier_rules]
+            for i, country in enumerate(countries):
+                pairs.append((country.id, rule_ids[i % len(rule_ids)]))
+        return pairs
+
+    def destination(self):
+        """Return a random (country ID, rule ID) pair for an order."""
+        rule = self.random.choice(self.shipping_rules.shipping_rules)
+        roll = self.random.random()
+        if roll < 0.02:
+            return self.UNKNOWN_COUNTRY_ID, self.random.choice(rule.rule_ids)
+        if roll < 0.04:
+            return self.random.choice(list(countries)).id, self.UNKNOWN_RULE_ID
+        if roll < 0.2 or rule.rule_ids is None:
+            country = self.random.choice(list(countries))
+            rule_id = self.random.choice(self.courier_rules).id
+            return country.id, rule_id
+        if rule.country_ids:
+            country_id = self.random.choice(rule.country_ids)
+        else:
+            country_id = self.random.choice(list(countries)).id
+        return country_id, self.random.choice(rule.rule_ids)
+
+    def dispatch_order(self, number, country_id, rule_id):
+        """Return a fake Cloud Commerce dispatch order."""
+        product_count = self.random.choice((1, 1, 1, 2, 3, 5))
+        return SimpleNamespace(
+            order_id=str(100000 + number),
+            customer_id=str(self.random.randint(1, 10000)),
+            date_recieved=None,
+            dispatch_date=None,
+            delivery_country_code=country_id,
+            total_gross_gbp=f"{self.random.uniform(0.5, 250):.2f}",
+            default_cs_rule_name=f"{self.courier_rule_name(rule_id)} - Service",
+            products=[self.order_product() for _ in range(product_count)],
+        )
+
+    def set_currency_rates(self):
+        """Replace country exchange rates with the fake rates."""
+        saved = {}
+        for country in countries:
+            saved[country.id] = country.__dict__.get("_currency_rate")
+            country.cache = None
+            if country.currency_code in self.currency_rates:
+                country._currency_rate = self.currency_rates[country.currency_code]
+        return saved
+
+    @staticmethod
+    def restore_currency_rates(saved):
+        """Restore country exchange rates replaced by set_currency_rates."""
+        for country in countries:
+            if saved[country.id] is None:
+                country.__dict__.pop("_currency_rate", None)
+            else:
+                country._currency_rate = saved[country.id]
+
+    def open_product_cache(self, directory):
+        """Create Harness.product_cache in directory and fill it."""
+        self.product_cache = ProfitCache(directory)
+        for product_id in self.products:
+            product = Product(
+                self,
+                SimpleNamespace(
+                    product_id=product_id,
+                    sku=f"SKU-{product_id}",
+                    quantity=1,
+                    per_item_weight=0,
+                ),
+            )
+            self.product_cache.set_product(product_id, product.load_product_data())
+
+    def close_product_cache(self):
+        """Close Harness.product_cache."""
+        self.product_cache.close()
+        self.product_cache = None
+
+    def cached(self):
+        """Return a view of the harness loading products from its cache."""
+        return SimpleNamespace(
+            courier_rules=self.courier_rules,
+            shipping_rules=self.shipping_rules,
+            products=self.products,
+            cache=self.product_cache,
+            deadline=None,
+        )
+
+
+def courier_outcome(update, dispatch_order, get_shipping_rule):
+    """
+    Return the shipping rule for an order, or the reason it has none.
+
+    Args:
+        update: Object with courier_rules and shipping_rules attributes.
+        dispatch_order: The dispatch order.
+        get_shipping_rule: Callable taking a country ID and rule ID and
+            returning the shipping rule or raising an exception.
+
+    """
+    courier_name = dispatch_order.default_cs_rule_name.split(" - ")[0]
+    rules = [r for r in update.courier_rules if r.name == courier_name]
+    if not rules:
+        return "CourierRuleNotFound"
+    try:
+        return get_shipping_rule(dispatch_order.delivery_country_code, rules[0].id)
+    except Exception as e:
+        return type(e).__name__
+
+
+def reference_shipping_rule(update, country_id, rule_id):
+    """Return the shipping rule for an order by checking every rule."""
+    rules = [
+        r
+        for r in update.shipping_rules.shipping_rules
+        if r.matches(country_id, rule_id)
+    ]
+    if len(rules) == 1:
+        return rules[0]
+    if len(rules) == 0:
+        raise exceptions.NoShippingRule(country_id, rule_id)
+    raise exceptions.TooManyShippingRules(rules, country_id, rule_id)
+
+
+def reference_shipping_rule_path(harness, population):
+    """Find shipping rules by checking every rule."""
+    results = {}
+    for dispatch_order in population:
+        courier = courier_outcome(
+            harness,
+            dispatch_order,
+            lambda country_id, rule_id: reference_shipping_rule(
+                harness, country_id, rule_id
+            ),
+        )
+        if not isinstance(courier, str):
+            courier = courier.name
+        results[int(dispatch_order.order_id)] = {"courier": courier}
+    return results
+
+
+def reference_order(update, dispatch_order):
+    """
+    Return the Profit/Loss fields of an order using the reference calculation.
+
+    This is a direct, eager implementation of the calculation in
+    order_profit.order.Order which does not use any caching, indexing or
+    staging.
+
+    """
+    courier = courier_outcome(
+        update,
+        dispatch_order,
+        lambda country_id, rule_id: reference_shipping_rule(
+            update, country_id, rule_id
+        ),
+    )
+    if isinstance(courier, str):
+        return {"error": True, "courier": courier}
+    if dispatch_order.delivery_country_code not in countries.countries:
+        return {"error": True, "courier": courier.name}
+    country = countries[dispatch_order.delivery_country_code]
+    price = int(float(dispatch_order.total_gross_gbp) * 100)
+    products = [Product(update, p) for p in dispatch_order.products]
+    departments = list(set(p.department for p in products))
+    department = departments[0] if len(departments) == 1 else "Mixed"
+    weight = sum(p.weight * p.quantity for p in products)
+    item_count = sum(p.quantity for p in products)
+    vat_rates = list(set(p.vat_rate for p in products))
+    if country.region == country.REST_OF_WORLD:
+        vat_rate = 0
+    elif len(vat_rates) == 1:
+        vat_rate = vat_rates[0]
+    else:
+        vat_rate = None
+    purchase_price = sum(p.purchase_price * p.quantity for p in products)
+    order = SimpleNamespace(
+        country=country, weight=weight, order_id=int(dispatch_order.order_id)
+    )
+    try:
+        postage_price = courier.calculate_price(order)
+    except Exception:
+        return {"error": True, "courier": courier.name}
+    min_channel_fee = 0
+    if country.currency_code is not None:
+        min_channel_fee = int(
+            (country.min_channel_fee_local * country.currency_rate) * 100
+        )
+    channel_fee = max(int(float(price / 100) * 15), min_channel_fee)
+    profit = 0
+    if courier.is_valid_service is True:
+        profit = price - sum([postage_price, purchase_price, channel_fee])
+    vat = None
+    profit_vat = None
+    if vat_rate is not None:
+        vat = int((price / 100) * vat_rate)
+        profit_vat = profit - vat if courier.is_valid_service is True else 0
+    return {
+        "error": False,
+        "courier": courier.name,
+        "is_valid_service": courier.is_valid_service,
+        "department": department,
+        "weight": weight,
+        "item_count": item_count,
+        "vat_rate": vat_rate,
+        "purchase_price": purchase_price,
+        "postage_price": postage_price,
+        "channel_fee": channel_fee,
+        "profit": profit,
+        "vat": vat,
+        "profit_vat": profit_vat,
+    }
+
+
+def order_fields(order):
+    """Return the Profit/Loss fields of an order_profit.order.Order."""
+    if order.error is True:
+        return {"error": True}
+    fields = {field: getattr(order, field) for field in FIELDS}
+    fields["courier"] = order.courier.name
+    fields["error"] = False
+    return fields
+
+
+def reference_orders_path(harness, population):
+    """Calculate orders with the reference calculation."""
+    return {
+        int(dispatch_order.order_id): reference_order(harness, dispatch_order)
+        for dispatch_order in population
+    }
+
+
+def lazy_order_path(harness, population):
+    """Calculate orders with order_profit.order.Order."""
+    return {
+        int(dispatch_order.order_id): order_fields(Order(harness, dispatch_order))
+        for dispatch_order in population
+    }
+
+
+class HarnessOrderProfit(OrderProfit):
+    """OrderProfit loading its orders and products from a Harness."""
+
+    def __init__(self, harness, population):
+        """Create a pipeline for a population of harness orders."""
+        self.harness = harness
+        self.population = population
+        super().__init__(progress=False, run=False)
+        self.products.update(harness.products)
+
+    def get_courier_rules(self):
+        """Return the harness's courier rules."""
+        return self.harness.courier_rules
+
+    def get_orders(self):
+        """Return the population of harness orders."""
+        return self.population
+
+
+def cached_product_path(harness, population):
+    """Calculate orders loading product data from a ProfitCache."""
+    cached = harness.cached()
+    return {
+        int(dispatch_order.order_id): order_fields(Order(cached, dispatch_order))
+        for dispatch_order in population
+    }
+
+
+def staged_pipeline_path(harness, population):
+    """Calculate orders with the staged OrderProfit pipeline."""
+    order_profit = HarnessOrderProfit(harness, population)
+    order_profit.run()
+    results = {order.order_id: {"error": True} for order in order_profit.invalid_orders}
+    for order in order_profit.coverage.completed:
+        results[order.order_id] = order_fields(order)
+    return results
+
+
+def shipping_rule_index_path(harness, population):
+    """Find shipping rules with the indexed ShippingRules lookup."""
+    results = {}
+    for dispatch_order in population:
+        courier = courier_outcome(
+            harness, dispatch_order, harness.shipping_rules.get_shipping_rule
+        )
+        if not isinstance(courier, str):
+            courier = courier.name
+        results[int(dispatch_order.order_id)] = {"courier": courier}
+    return results
+
+
+def profit_index_path(harness, population):
+    """Recalculate order profit from the ProfitIndex allocations."""
+    orders = [Order(harness, dispatch_order) for dispatch_order in population]
+    orders = [order for order in orders if order.error is False]
+    index = ProfitIndex(orders)
+    results = {order.order_id: {"profit": 0} for order in orders}
+    for rows in index.products.values():
+        for row in rows:
+            results[row["order_id"]]["profit"] += row["profit"]
+    return results
+
+
+FAST_PATHS = {
+    "lazy_order": lazy_order_path,
+    "cached_product": cached_product_path,
+    "staged_pipeline": staged_pipeline_path,
+    "shipping_rule_index": shipping_rule_index_path,
+    "profit_index": profit_index_path,
+}
+
+# The reference step doing the same work as each fast path, used to time it.
+REFERENCE_PATHS = {
+    "lazy_order": reference_orders_path,
+    "cached_product": reference_orders_path,
+    "staged_pipeline": reference_orders_path,
+    "shipping_rule_index": reference_shipping_rule_path,
+    "profit_index": reference_orders_path,
+}
+
+
+class Mismatch:
+    """
+    A difference between a fast path and the reference calculation.
+
+    Attributes:
+        path: The name of the fast path.
+        order_id: The ID of the order.
+        field: The field which differs.
+        expected: The reference value.
+        actual: The fast path's value.
+        reproduction: The minimized dispatch order reproducing the mismatch.
+
+    """
+
+    def __init__(self, path, order_id, field, expected, actual, reproduction):
+        """Record a mismatch."""
+        self.path = path
+        self.order_id = order_id
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        self.reproduction = reproduction
+
+    def __repr__(self):
+        return (
+            f"{self.path}: order {self.order_id} {self.field} expected "
+            f"{self.expected!r}, got {self.actual!r}\n"
+            f"Reproduction: {self.reproduction!r}"
+        )
+
+
+class Result:
+    """
+    The result of comparing a fast path with the reference calculation.
+
+    Attributes:
+        path: The name of the fast path.
+        mismatch: The first order_profit.differential.Mismatch found, or
+            None.
+        reference_time: Seconds taken by the reference step doing the same
+            work as the fast path.
+        fast_time: Seconds taken by the fast path.
+
+    """
+
+    def __init__(self, path, mismatch, reference_time, fast_time):
+        """Record a result."""
+        self.path = path
+        self.mismatch = mismatch
+        self.reference_time = reference_time
+        self.fast_time = fast_time
+
+    @property
+    def speedup(self):
+        """Return the reference time divided by the fast path time."""
+        if self.fast_time == 0:
+            return float("inf")
+        return self.reference_time / self.fast_time
+
+    def __repr__(self):
+        status = "OK" if self.mismatch is None else "MISMATCH"
+        return (
+            f"{self.path}: {status} reference {self.reference_time:.3f}s, "
+            f"fast {self.fast_time:.3f}s, speedup {self.speedup:.2f}x"
+        )
+
+
+def compare(expected, actual):
+    """
+    Return the first field differing between reference and fast results.
+
+    Only fields in the fast path's result are compared. A fast path may
+    omit an order only if the reference could not price it or it was sent
+    with an invalid shipping service.
+
+    Returns:
+        Tuple of (field, expected value, actual value) or None.
+
+    """
+    if actual is None:
+        if expected["error"] is True or expected["is_valid_service"] is False:
+            return None
+        return ("omitted", expected, None)
+    if "error" in actual and actual["error"] != expected["error"]:
+        return ("error", expected["error"], actual["error"])
+    for field, value in actual.items():
+        if field == "error" or (expected["error"] is True and field != "courier"):
+            continue
+        if field not in expected:
+            continue
+        if value != expected[field]:
+            return (field, expected[field], value)
+    return None
+
+
+def find_mismatch(harness, path, population, reference):
+    """Return the first (order ID, difference) between a path and reference."""
+    return first_difference(
+        population, reference, FAST_PATHS[path](harness, population)
+    )
+
+
+def first_difference(population, reference, results):
+    """Return the first (order ID, difference) between results and reference."""
+    for dispatch_order in population:
+        order_id = int(dispatch_order.order_id)
+        difference = compare(reference[order_id], results.get(order_id))
+        if difference is not None:
+            return order_id, difference
+    return None
+
+
+def minimize(harness, path, dispatch_order):
+    """
+    Return the smallest variation of an order which still mismatches.
+
+    Products are removed and quantities and weights simplified for as long
+    as the fast path still disagrees with the reference for the order on
+    its own.
+
+    """
+
+    def fails(candidate):
+        reference = {int(candidate.order_id): reference_order(harness, candidate)}
+        return find_mismatch(harness, path, [candidate], reference) is not None
+
+    def variations(order):
+        for i in range(len(order.products)):
+            if len(order.products) > 1:
+                yield copy_order(order, order.products[:i] + order.products[i + 1 :])
+        for i, product in enumerate(order.products):
+            for attribute, value in (("quantity", 1), ("per_item_weight", 0)):
+                if getattr(product, attribute) != value:
+                    products = list(order.products)
+                    products[i] = SimpleNamespace(**{**vars(product), attribute: value})
+                    yield copy_order(order, products)
+
+    if not fails(dispatch_order):
+        return dispatch_order
+    reduced = True
+    while reduced:
+        reduced = False
+        for candidate in variations(dispatch_order):
+            if fails(candidate):
+                dispatch_order = candidate
+                reduced = True
+                break
+    return dispatch_order
+
+
+def copy_order(dispatch_order, products):
+    """Return a copy of a fake dispatch order with different products."""
+    return SimpleNamespace(**{**vars(dispatch_order), "products": products})
+
+
+def timed(func, *args):
+    """Return the result of func and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(size=1000, seed=0, paths=None):
+    """
+    Compare fast paths with the reference calculation.
+
+    Each fast path is timed against the reference step doing the same work,
+    from order_profit.differential.REFERENCE_PATHS.
+
+    Args:
+        size: The number of orders to generate.
+        seed: The seed used to generate orders.
+        paths: Names of the fast paths to check, defaults to all of
+            order_profit.differential.FAST_PATHS.
+
+    Returns:
+        List of order_profit.differential.Result.
+
+    """
+    harness = Harness(size=size, seed=seed)
+    saved_rates = harness.set_currency_rates()
+    directory = tempfile.TemporaryDirectory()
+    harness.open_product_cache(directory.name)
+    try:
+        population = harness.population
+        reference = reference_orders_path(harness, population)
+        results = []
+        for path in paths or FAST_PATHS:
+            _, reference_time = timed(REFERENCE_PATHS[path], harness, population)
+            fast_results, fast_time = timed(FAST_PATHS[path], harness, population)
+            found = first_difference(population, reference, fast_results)
+            mismatch = None
+            if found is not None:
+                order_id, (field, expected, actual) = found
+                dispatch_order = next(
+                    o for o in harness.population if int(o.order_id) == order_id
+                )
+                mismatch = Mismatch(
+                    path,
+                    order_id,
+                    field,
+                    expected,
+                    actual,
+                    minimize(harness, path, dispatch_order),
+                )
+            results.append(Result(path, mismatch, reference_time, fast_time))
+    finally:
+        harness.close_product_cache()
+        directory.cleanup()
+        harness.restore_currency_rates(saved_rates)
+    return results
+
+
+def main(argv=None):
+    """Run the differential tests from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m order_profit.differential",
+        description="Compare fast paths with the reference order calculation.",
+    )
+    parser.add_argument("--size", type=int, default=1000, help="number of orders")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--path",
+        action="append",
+        choices=list(FAST_PATHS),
+        help="fast path to check, may be repeated; defaults to all",
+    )
+    args = parser.parse_args(argv)
+    results = run(size=args.size, seed=args.seed, paths=args.path)
+    for result in results:
+        print(result)
+        if result.mismatch is not None:
+            print(result.mismatch)
+    return 1 if any(result.mismatch is not None for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,22 @@
 """Exceptions for Order Profit."""
 
 
+class CourierRuleNotFound(Exception):
+    """Raised when no courier rule matches the name used by an order."""
+
+    text = "No courier rule found with name {} for order {}."
+
+    def __init__(self, courier_name, order_id):
+        """
+        Raise exception.
+
+        Args:
+            courier_name: The name of the courier rule used by the order.
+            order_id: The ID of the order.
+        """
+        return super().__init__(self.text.format(courier_name, order_id))
+
+
 class ShippingRuleNotFound(Exception):
     """Base exception for errors in finding shipping rules for orders."""
 
@@ -40,3 +56,33 @@ class TooManyShippingRules(ShippingRuleNotFound):
             rule_id: The ID of the shipping rule applied to the order.
         """
         return super().__init__(self.text.format(len(rules), country_id, rule_id))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request cannot be completed before a run's deadline."""
+
+    text = "Deadline exceeded while loading product {}."
+
+    def __init__(self, sku):
+        """
+        Raise exception.
+
+        Args:
+            sku: The SKU of the product being loaded.
+        """
+        return super().__init__(self.text.format(sku))
+
+
+class LimiterTimeout(Exception):
+    """Raised when a request is not allowed by a limiter before a deadline."""
+
+    text = "Deadline passed waiting to call {}."
+
+    def __init__(self, endpoint):
+        """
+        Raise exception.
+
+        Args:
+            endpoint: The name of the function waiting to be called.
+        """
+        return super().__init__(self.text.format(endpoint))
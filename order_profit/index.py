@@ -0,0 +1,158 @@
+"""Index of order profit attributed to products and ranges."""
+
+
+class ProfitIndex:
+    """
+    Inverted index of product and range IDs to the orders containing them.
+
+    The profit of each order is allocated to its line items in proportion
+    to their value, the purchase price multiplied by the quantity. If no
+    line item has a value the profit is allocated by quantity instead, and
+    if no line item has a quantity it is not allocated.
+    Allocations are whole pence and always sum to the order's profit.
+
+    Attributes:
+        products: Dict of product IDs to lists of attribution rows.
+        ranges: Dict of range IDs to lists of attribution rows.
+        product_totals: Dict of product IDs to their total allocated profit.
+        range_totals: Dict of range IDs to their total allocated profit.
+        order_ids: Set of the IDs of indexed orders.
+
+    Each attribution row is a dict containing the order_id, product_id,
+    range_id, sku, quantity and allocated profit of a line item.
+
+    """
+
+    def __init__(self, orders=None):
+        """
+        Create an index.
+
+        Args:
+            orders: Optional iterable of priced order_profit.order.Order to
+                add to the index.
+
+        """
+        self.products = {}
+        self.ranges = {}
+        self.product_totals = {}
+        self.range_totals = {}
+        self.order_ids = set()
+        for order in orders or []:
+            self.add(order)
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    def __contains__(self, order_id):
+        return order_id in self.order_ids
+
+    def add(self, order):
+        """
+        Add a priced order to the index.
+
+        Orders already in the index are ignored. An order with no line
+        items, or whose line items all have no quantity, is recorded in
+        ProfitIndex.order_ids but its profit is not attributed to any
+        product or range.
+
+        """
+        if order.order_id in self.order_ids:
+            return
+        self.order_ids.add(order.order_id)
+        allocations = self.allocate(
+            order.profit, [self.line_value(product) for product in order.products]
+        )
+        if allocations is None:
+            allocations = self.allocate(
+                order.profit, [product.quantity for product in order.products]
+            )
+        if allocations is None:
+            return
+        for product, profit in zip(order.products, allocations):
+            row = {
+                "order_id": order.order_id,
+                "product_id": product.product_id,
+                "range_id": product.range_id,
+                "sku": product.sku,
+                "quantity": product.quantity,
+                "profit": profit,
+            }
+            self.products.setdefault(product.product_id, []).append(row)
+            self.ranges.setdefault(product.range_id, []).append(row)
+            self.product_totals[product.product_id] = (
+                self.product_totals.get(product.product_id, 0) + profit
+            )
+            self.range_totals[product.range_id] = (
+                self.range_totals.get(product.range_id, 0) + profit
+            )
+
+    @staticmethod
+    def line_value(product):
+        """Return the value of a line item in GBP pence."""
+        return product.purchase_price * product.quantity
+
+    @staticmethod
+    def allocate(amount, weights):
+        """
+        Return amount split into whole pence in proportion to weights.
+
+        Remainders are allocated to the largest fractional shares so the
+        allocations sum to amount.
+
+        Returns:
+            List of allocations, or None if the weights sum to zero.
+
+        """
+        total = sum(weights)
+        if total == 0:
+            return None
+        sign = -1 if amount < 0 else 1
+        shares = [abs(amount) * weight / total for weight in weights]
+        allocations = [int(share) for share in shares]
+        remainder = abs(amount) - sum(allocations)
+        by_fraction = sorted(
+            range(len(shares)),
+            key=lambda i: shares[i] - allocations[i],
+            reverse=True,
+        )
+        for i in by_fraction[:remainder]:
+            allocations[i] += 1
+        return [sign * allocation for allocation in allocations]
+
+    def product_profit(self, product_id):
+        """Return the total profit allocated to a product."""
+        return self.product_totals.get(product_id, 0)
+
+    def range_profit(self, range_id):
+        """Return the total profit allocated to a range."""
+        return self.range_totals.get(range_id, 0)
+
+    def product_rows(self, product_id):
+        """Return the attribution rows for a product."""
+        return self.products.get(product_id, [])
+
+    def range_rows(self, range_id):
+        """Return the attribution rows for a range."""
+        return self.ranges.get(range_id, [])
+
+    def losses(self, by="product"):
+        """
+        Return products or ranges with a negative total profit.
+
+        Args:
+            by: "product" or "range".
+
+        Returns:
+            List of tuples of (ID, total profit), largest loss first.
+
+        """
+        if by == "product":
+            totals = self.product_totals
+        elif by == "range":
+            totals = self.range_totals
+        else:
+            raise ValueError(f"Cannot group losses by {by}.")
+        return sorted(
+            ((key, profit) for key, profit in totals.items() if profit < 0),
+            key=lambda item: item[1],
+        )
@@ -0,0 +1,475 @@
+"""Resumable, partitioned Order Profit jobs."""
+
+import datetime
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from .store import ProfitStore
+
+logger = logging.getLogger("order_profit")
+
+
+class Partition:
+    """
+    A date range of orders to be processed by a single worker.
+
+    Attributes:
+        id: The ID of the partition in the job queue.
+        start: The first dispatch date included in the partition.
+        end: The day after the last dispatch date included in the partition.
+        status: The status of the partition in the job queue.
+        worker: The ID of the worker which last claimed the partition.
+        attempts: The number of times the partition has been claimed.
+        output: The path to the ProfitStore database containing the
+            partition's results, once complete.
+
+    """
+
+    def __init__(self, row):
+        """
+        Load partition data from a job queue row.
+
+        Args:
+            row: sqlite3.Row from the partitions table.
+
+        """
+        self.id = row["id"]
+        self.start = datetime.date.fromisoformat(row["start"])
+        self.end = datetime.date.fromisoformat(row["end"])
+        self.status = row["status"]
+        self.worker = row["worker"]
+        self.attempts = row["attempts"]
+        self.output = row["output"]
+
+    def __repr__(self):
+        return f"Partition {self.id} ({self.start} to {self.end})"
+
+
+class JobQueue:
+    """
+    SQLite backed queue of date range partitions.
+
+    Workers claim a partition for a lease period and must renew the lease
+    with JobQueue.heartbeat until the partition is complete. A partition
+    whose lease expires, for example because its worker crashed, is
+    returned to the queue and can be claimed by another worker.
+
+    The queue can be shared by workers on several hosts by placing it on a
+    shared filesystem that supports SQLite file locking.
+
+    Cloud Commerce only returns dispatched orders for a number of days up
+    to today, so loading the orders for a partition means loading every
+    order since its start. Partitions are claimed earliest first so that
+    each Worker can load the orders once, with its first partition, and
+    filter them for the partitions it claims after.
+
+    Attributes:
+        path: The path to the SQLite database file.
+        lease: The number of seconds a claim lasts without a heartbeat.
+        max_attempts: The number of times a partition is claimed before it
+            is marked as failed.
+
+    """
+
+    PENDING = "pending"
+    CLAIMED = "claimed"
+    COMPLETE = "complete"
+    FAILED = "failed"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS partitions (
+            id INTEGER PRIMARY KEY,
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            status TEXT NOT NULL,
+            worker TEXT,
+            heartbeat REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            output TEXT,
+            error TEXT,
+            UNIQUE (start, end)
+        );
+        CREATE INDEX IF NOT EXISTS partitions_status ON partitions (status);
+    """
+
+    def __init__(self, path, lease=600, max_attempts=3):
+        """
+        Open the job queue, creating it if it does not exist.
+
+        Args:
+            path: The path to the SQLite database file.
+            lease: The number of seconds a claim lasts without a heartbeat.
+            max_attempts: The number of times a partition is claimed before
+                it is marked as failed.
+
+        """
+        self.path = str(path)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        with self.connect() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def connect(self):
+        """
+        Return a new connection to the job queue.
+
+        A connection is opened for each operation so the queue can be used
+        from several threads and processes.
+
+        """
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return ConnectionContext(connection)
+
+    def add_range(self, start, end, days=1):
+        """
+        Add partitions covering a date range to the queue.
+
+        Partitions already in the queue are not added again.
+
+        Args:
+            start: The first dispatch date to include.
+            end: The day after the last dispatch date to include.
+            days: The number of days in each partition.
+
+        Returns:
+            The number of partitions added.
+
+        """
+        count = 0
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            partition_start = start
+            while partition_start < end:
+                partition_end = min(
+                    partition_start + datetime.timedelta(days=days), end
+                )
+                count += connection.execute(
+                    "INSERT OR IGNORE INTO partitions (start, end, status) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        partition_start.isoformat(),
+                        partition_end.isoformat(),
+                        self.PENDING,
+                    ),
+                ).rowcount
+                partition_start = partition_end
+            connection.execute("COMMIT")
+        return count
+
+    def claim(self, worker):
+        """
+        Claim the next available partition.
+
+        Partitions whose lease has expired are reclaimed, or marked as
+        failed if they have been claimed JobQueue.max_attempts times.
+
+        Args:
+            worker: The ID of the worker claiming the partition.
+
+        Returns:
+            order_profit.jobs.Partition or None if no partition is available.
+
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "UPDATE partitions SET status = ?, error = ? "
+                "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                (
+                    self.FAILED,
+                    "Lease expired",
+                    self.CLAIMED,
+                    now - self.lease,
+                    self.max_attempts,
+                ),
+            )
+            row = connection.execute(
+                "SELECT id FROM partitions "
+                "WHERE status = ? OR (status = ? AND heartbeat < ?) "
+                "ORDER BY start LIMIT 1",
+                (self.PENDING, self.CLAIMED, now - self.lease),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE partitions SET status = ?, worker = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (self.CLAIMED, worker, now, row["id"]),
+            )
+            partition = self.get(row["id"], connection=connection)
+            connection.execute("COMMIT")
+        return partition
+
+    def heartbeat(self, partition, worker):
+        """
+        Renew the lease on a claimed partition.
+
+        Returns:
+            False if the partition is no longer claimed by the worker.
+
+        """
+        return self.update(
+            partition, worker, status=self.CLAIMED, heartbeat=time.time()
+        )
+
+    def complete(self, partition, worker, output):
+        """
+        Mark a partition as complete.
+
+        Args:
+            partition: The completed order_profit.jobs.Partition.
+            worker: The ID of the worker which completed the partition.
+            output: The path to the ProfitStore database containing the
+                partition's results.
+
+        Returns:
+            False if the partition is no longer claimed by the worker.
+
+        """
+        return self.update(partition, worker, status=self.COMPLETE, output=output)
+
+    def fail(self, partition, worker, error):
+        """
+        Return a partition to the queue after an error.
+
+        The partition is marked as failed if it has been claimed
+        JobQueue.max_attempts times.
+
+        Returns:
+            False if the partition is no longer claimed by the worker.
+
+        """
+        status = self.PENDING
+        if partition.attempts >= self.max_attempts:
+            status = self.FAILED
+        return self.update(partition, worker, status=status, error=str(error))
+
+    def update(self, partition, worker, **values):
+        """Update a partition if it is still claimed by worker."""
+        columns = ", ".join(f"{column} = ?" for column in values)
+        with self.connect() as connection:
+            updated = connection.execute(
+                f"UPDATE partitions SET {columns} "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (*values.values(), partition.id, worker, self.CLAIMED),
+            ).rowcount
+        return updated == 1
+
+    def get(self, partition_id, connection=None):
+        """Return a partition by ID."""
+        if connection is None:
+            with self.connect() as connection:
+                return self.get(partition_id, connection=connection)
+        row = connection.execute(
+            "SELECT * FROM partitions WHERE id = ?", (partition_id,)
+        ).fetchone()
+        return Partition(row)
+
+    def partitions(self, status=None):
+        """Return list of partitions, optionally filtered by status."""
+        with self.connect() as connection:
+            if status is None:
+                rows = connection.execute("SELECT * FROM partitions ORDER BY start")
+            else:
+                rows = connection.execute(
+                    "SELECT * FROM partitions WHERE status = ? ORDER BY start",
+                    (status,),
+                )
+            return [Partition(row) for row in rows]
+
+    def status(self):
+        """Return dict of partition statuses to the number of partitions."""
+        with self.connect() as connection:
+            return {
+                row["status"]: row["count"]
+                for row in connection.execute(
+                    "SELECT status, COUNT(*) AS count FROM partitions "
+                    "GROUP BY status"
+                )
+            }
+
+    def merge(self, store):
+        """
+        Merge the results of every complete partition into a ProfitStore.
+
+        Args:
+            store: order_profit.store.ProfitStore into which results are
+                merged.
+
+        Returns:
+            The number of orders merged.
+
+        """
+        return sum(
+            store.merge(partition.output)
+            for partition in self.partitions(status=self.COMPLETE)
+        )
+
+
+class ConnectionContext:
+    """Context manager closing an SQLite connection on exit."""
+
+    def __init__(self, connection):
+        """Store the connection."""
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None and self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.close()
+
+
+class Worker:
+    """
+    Process partitions from a job queue.
+
+    Each partition's results are written to a separate ProfitStore database
+    in the output directory, so they can be merged with JobQueue.merge.
+
+    The dispatched orders loaded for a partition are kept and reused for
+    later partitions, as they cover every date from the partition's start
+    to today. They are only loaded again if a partition starting earlier is
+    claimed, for example one returned to the queue by another worker. Each
+    worker therefore loads the orders about once, rather than once per
+    partition, at the cost of keeping them in memory.
+
+    Attributes:
+        queue: order_profit.jobs.JobQueue from which partitions are claimed.
+        output_directory: The directory in which results are written.
+        worker_id: The unique ID of the worker.
+        order_profit_class: Callable taking the keyword arguments of
+            order_profit.OrderProfit and returning an OrderProfit.
+        dispatch_orders: The dispatched orders loaded from Cloud Commerce,
+            or None.
+        dispatch_orders_start: The earliest date covered by
+            Worker.dispatch_orders.
+
+    """
+
+    def __init__(self, queue, output_directory, worker_id=None, order_profit=None):
+        """
+        Create a worker.
+
+        Args:
+            queue: order_profit.jobs.JobQueue from which partitions are
+                claimed.
+            output_directory: The directory in which results are written.
+            worker_id: The unique ID of the worker. Defaults to the host
+                name and process ID.
+            order_profit: Callable taking the keyword arguments of
+                order_profit.OrderProfit and returning an OrderProfit.
+                Defaults to OrderProfit.
+
+        """
+        if order_profit is None:
+            from .order_profit import OrderProfit
+
+            order_profit = OrderProfit
+        self.queue = queue
+        self.output_directory = str(output_directory)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.order_profit_class = order_profit
+        self.dispatch_orders = None
+        self.dispatch_orders_start = None
+        os.makedirs(self.output_directory, exist_ok=True)
+
+    def run(self, limit=None):
+        """
+        Process partitions until none are available.
+
+        Args:
+            limit: The maximum number of partitions to process.
+
+        Returns:
+            The number of partitions completed.
+
+        """
+        completed = 0
+        while limit is None or completed < limit:
+            partition = self.queue.claim(self.worker_id)
+            if partition is None:
+                break
+            if self.run_partition(partition) is True:
+                completed += 1
+        return completed
+
+    def run_partition(self, partition):
+        """
+        Process a claimed partition, renewing its lease while it runs.
+
+        Returns:
+            True if the partition was completed.
+
+        """
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.send_heartbeats, args=(partition, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            output = self.process(partition)
+        except Exception as e:
+            logger.exception(e)
+            self.queue.fail(partition, self.worker_id, e)
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+        return self.queue.complete(partition, self.worker_id, output)
+
+    def send_heartbeats(self, partition, stop):
+        """Renew the lease on a partition until stop is set."""
+        while not stop.wait(self.queue.lease / 3):
+            if self.queue.heartbeat(partition, self.worker_id) is not True:
+                logger.warning(f"{partition} was reclaimed from {self.worker_id}.")
+                return
+
+    def output_path(self, partition):
+        """Return the path of the results database for a partition."""
+        filename = f"{partition.start.isoformat()}_{partition.end.isoformat()}.sqlite3"
+        return os.path.join(self.output_directory, filename)
+
+    def load_dispatch_orders(self, start):
+        """
+        Return dispatched orders covering every date from start to today.
+
+        Orders already loaded for an earlier or equal start date are reused.
+
+        """
+        if self.dispatch_orders is None or start < self.dispatch_orders_start:
+            order_profit = self.order_profit_class(start=start, run=False)
+            self.dispatch_orders = list(order_profit.get_orders())
+            self.dispatch_orders_start = start
+        return self.dispatch_orders
+
+    def process(self, partition):
+        """
+        Calculate the Profit/Loss data for a partition.
+
+        Returns:
+            The path to the ProfitStore database containing the results.
+
+        """
+        path = self.output_path(partition)
+        temp_path = f"{path}.{self.worker_id.replace(os.sep, '_')}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        order_profit = self.order_profit_class(
+            start=partition.start,
+            end=partition.end,
+            dispatch_orders=self.load_dispatch_orders(partition.start),
+        )
+        with ProfitStore(temp_path) as store:
+            store.add(order_profit)
+        os.replace(temp_path, path)
+        return path
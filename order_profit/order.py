@@ -1,17 +1,48 @@
 """The Order class."""
 
 import logging
+from functools import cached_property, wraps
 
+from . import exceptions
 from .countries import countries
 from .product import Product
 
 logger = logging.getLogger("order_profit")
 
 
+def derived_field(method):
+    """
+    Return a cached Order field which falls back to its default on failure.
+
+    If the field, or any field it depends on, cannot be calculated the
+    order is marked as an error with Order.fail and the field's default
+    from Order.DEFAULTS is returned.
+
+    """
+
+    @wraps(method)
+    def getter(order):
+        try:
+            value = method(order)
+        except Exception as e:
+            order.fail(e)
+        if order.__dict__.get("error") is True:
+            return order.DEFAULTS[method.__name__]
+        return value
+
+    return cached_property(getter)
+
+
 class Order:
     """
     Information about a Cloud Commerce Order with Profit Loss data.
 
+    Fields derived from the order's products or shipping rule are calculated
+    on first access and cached, so only the data each field depends on is
+    loaded. Accessing Order.error, or calling Order.process, calculates them
+    all. If any field cannot be calculated the order is marked as an error
+    and every field not yet calculated takes its value from Order.DEFAULTS.
+
     Attributes:
         update: order_pofit.OrderProfit creating the product.
         dispatch_order: Order data from CCAPI.
@@ -36,9 +67,43 @@ class Order:
         profit: The profit made on the order before VAT.
         vat: The VAT charged on the order.
         profit_vat: The profit made on the order after VAT.
+        error: True if the profit for the order could not be calculated.
+        exception: The exception which caused the order to be marked as an
+            error, or None.
+        priced: True if the order has been priced successfully.
 
     """
 
+    DERIVED_FIELDS = (
+        "department",
+        "weight",
+        "item_count",
+        "vat_rate",
+        "purchase_price",
+        "courier",
+        "postage_price",
+        "channel_fee",
+        "profit",
+        "vat",
+        "profit_vat",
+    )
+
+    DEFAULTS = {
+        "country": None,
+        "products": [],
+        "department": "",
+        "weight": 0,
+        "item_count": 0,
+        "vat_rate": 0,
+        "purchase_price": 0,
+        "courier": None,
+        "postage_price": None,
+        "channel_fee": 0,
+        "profit": 0,
+        "vat": 0,
+        "profit_vat": 0,
+    }
+
     def __init__(self, update, dispatch_order):
         """
         Load order data.
@@ -55,50 +120,143 @@ class Order:
         self.date_recieved = self.dispatch_order.date_recieved
         self.dispatch_date = self.dispatch_order.dispatch_date
         self.country_code = dispatch_order.delivery_country_code
-        self.country = countries[self.country_code]
         self.price = int(float(self.dispatch_order.total_gross_gbp) * 100)
-        self.purchase_price = None
-        self.courier = None
-        self.item_count = None
-        self.postage_price = None
-        self.products = []
-        self.error = False
-        self.department = ""
-        self.weight = 0
-        self.item_count = 0
-        self.vat_rate = 0
-        self.purchase_price = 0
-        self.channel_fee = 0
-        self.profit = 0
-        self.vat = 0
-        self.profit_vat = 0
-        try:
-            self.process()
-        except Exception as e:
-            logger.exception(e)
-            self.error = True
+        self.exception = None
+
+    def validate(self):
+        """
+        Check the order can be priced using only the order data.
+
+        Resolves the destination country and the shipping rule, and
+        calculates the postage price, without loading any products.
+
+        Raises:
+            KeyError: If the destination country is unknown.
+            order_profit.exceptions.CourierRuleNotFound: If the order's
+                courier rule name is unknown.
+            order_profit.exceptions.ShippingRuleNotFound: If no single
+                shipping rule applies to the order.
+            Exception: If the shipping rule has no price for the order,
+                for example a service not available to its destination.
+
+        """
+        self.country
+        self.courier
+        self.postage_price
+        if self.exception is not None:
+            raise self.exception
 
     def process(self):
-        """Process the details of the order."""
-        for product in self.dispatch_order.products:
-            self.products.append(Product(self.update, product))
-        self.department = self.get_department()
-        self.weight = sum([p.weight * p.quantity for p in self.products])
-        self.item_count = sum([p.quantity for p in self.products])
-        self.vat_rate = self.calculate_vat()
-        self.purchase_price = sum(
-            [p.purchase_price * p.quantity for p in self.products]
+        """Calculate every derived field of the order."""
+        for field in self.DERIVED_FIELDS:
+            getattr(self, field)
+
+    def fail(self, exception):
+        """
+        Mark the order as an error.
+
+        Every field not yet calculated is set to its default so that no
+        further attempt is made to load the data it depends on. Only the
+        first failure is recorded.
+
+        """
+        if self.exception is not None:
+            return
+        logger.exception(exception)
+        self.exception = exception
+        self.__dict__["error"] = True
+        for field, default in self.DEFAULTS.items():
+            if field not in self.__dict__:
+                self.__dict__[field] = list(default) if field == "products" else default
+
+    @property
+    def priced(self):
+        """
+        Return True if the order has been priced successfully.
+
+        Unlike Order.error this does not calculate any fields.
+
+        """
+        return self.__dict__.get("error") is False
+
+    @cached_property
+    def error(self):
+        """Return True if the profit for the order could not be calculated."""
+        self.process()
+        return self.__dict__.get("error", False)
+
+    @derived_field
+    def country(self):
+        """Return the country to which the order was sent."""
+        return countries[self.country_code]
+
+    @derived_field
+    def products(self):
+        """Return the products in the order, loading them from Cloud Commerce."""
+        return [Product(self.update, p) for p in self.dispatch_order.products]
+
+    @derived_field
+    def department(self):
+        """Return the department to which the ordered products belong."""
+        return self.get_department()
+
+    @derived_field
+    def weight(self):
+        """Return the total weight of the order in grams."""
+        return sum(
+            [p.per_item_weight * p.quantity for p in self.dispatch_order.products]
         )
-        self.courier = self.get_courier()
-        self.postage_price = self.courier.calculate_price(self)
-        self.channel_fee = self.get_channel_fee()
-        self.profit = self.get_profit(self.price, self.purchase_price, self.channel_fee)
-        if self.vat_rate is not None:
-            self.vat = int((self.price / 100) * self.vat_rate)
-            self.profit_vat = self.get_profit_vat(self.profit, self.vat)
-        else:
-            self.vat = None
-            self.profit_vat = None
+
+    @derived_field
+    def item_count(self):
+        """Return the total number of items ordered."""
+        return sum([p.quantity for p in self.dispatch_order.products])
+
+    @derived_field
+    def vat_rate(self):
+        """Return the rate of VAT charged on the order."""
+        return self.calculate_vat()
+
+    @derived_field
+    def purchase_price(self):
+        """Return the cost of the purchased items."""
+        return sum([p.purchase_price * p.quantity for p in self.products])
+
+    @derived_field
+    def courier(self):
+        """Return the shipping rule used to send the order."""
+        return self.get_courier()
+
+    @derived_field
+    def postage_price(self):
+        """Return the cost to send the order."""
+        return self.courier.calculate_price(self)
+
+    @derived_field
+    def channel_fee(self):
+        """Return the fee charged by the selling channel."""
+        return self.get_channel_fee()
+
+    @derived_field
+    def profit(self):
+        """Return the profit made on the order before VAT."""
+        if self.courier.is_valid_service is not True:
+            return 0
+        return self.get_profit(self.price, self.purchase_price, self.channel_fee)
+
+    @derived_field
+    def vat(self):
+        """Return the VAT charged on the order."""
+        if self.vat_rate is None:
+            return None
+        return int((self.price / 100) * self.vat_rate)
+
+    @derived_field
+    def profit_vat(self):
+        """Return the profit made on the order after VAT."""
+        if self.vat is None:
+            return None
+        return self.get_profit_vat(self.profit, self.vat)
 
     def to_dict(self):
         """Return dict of product data."""
@@ -144,11 +302,7 @@ class Order:
         try:
             rule = [r for r in self.update.courier_rules if r.name == courier_name][0]
         except IndexError:
-            raise Exception(
-                "No courier rule found with name {} for order {}.".format(
-                    courier_name, self.order_id
-                )
-            )
+            raise exceptions.CourierRuleNotFound(courier_name, self.order_id)
         return rule.id
 
     def get_courier(self):
@@ -1,30 +1,190 @@
 """The Order Profit class."""
 
+import datetime
+import logging
 import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 
 from ccapi import CCAPI
 
+from .concurrency import ccapi_limiter
+from .countries import countries
+from .coverage import CoverageReport
+from .index import ProfitIndex
 from .order import Order
+from .product import Product
+from .sampling import StratifiedSample
 from .shipping import ShippingRules
 
+logger = logging.getLogger("order_profit")
+
 
 class OrderProfit:
-    """Retrive Profit/Loss data from Cloud Commerce Pro."""
+    """
+    Retrive Profit/Loss data from Cloud Commerce Pro.
+
+    Orders are processed in stages, cheapest first, so that orders which
+    cannot be priced are rejected before any products are loaded for them:
+
+        1. Load the dispatched orders.
+        2. Validate every order using only the order data. This resolves the
+           destination country, courier rule and shipping rule, and prices
+           the postage.
+        3. Load the products for, and price, the orders which passed
+           validation and were sent with a valid shipping service. Each
+           product is requested once, with concurrency controlled by
+           order_profit.concurrency.ccapi_limiter.
+
+    If a deadline is given, orders needing the fewest product requests are
+    priced first and the run stops when the deadline passes. The orders
+    priced, and the reason any order was not, are recorded in
+    OrderProfit.coverage.
+
+    If a sample size is given, only a stratified random sample of the
+    priceable orders is priced, and estimated totals for all of them are
+    made in OrderProfit.estimate.
+
+    Attributes:
+        courier_rules: Courier rules from Cloud Commerce.
+        shipping_rules: order_profit.shipping.ShippingRules.
+        products: Dict of product IDs to loaded inventory products.
+        cache: order_profit.cache.ProfitCache for product data and exchange
+            rates, or None.
+        orders: List of every order as order_profit.order.Order.
+        valid_orders: List of orders which passed validation.
+        invalid_orders: List of orders which failed validation.
+        start: The first dispatch date for which orders are included.
+        end: Orders dispatched on or after this date are not included.
+        deadline: The time.monotonic() time at which the run stops, or None.
+        coverage: order_profit.coverage.CoverageReport of the orders priced.
+        sample: order_profit.sampling.StratifiedSample of the orders priced,
+            or None if every order is priced.
+        estimate: order_profit.sampling.ProfitEstimate of the totals for
+            every priceable order, or None if no sample was taken.
+        index: order_profit.index.ProfitIndex attributing the profit of the
+            priced orders to their products and ranges, or None if it is not
+            needed.
+
+    """
 
     number_of_days = 1
+    workers = None
+    progress = True
 
-    def __init__(self):
-        """Load Profit/Loss data from Cloud Commerce."""
-        self.courier_rules = CCAPI.get_courier_rules()
-        self.shipping_rules = ShippingRules()
+    def __init__(
+        self,
+        start=None,
+        end=None,
+        fetch_products=True,
+        workers=None,
+        cache=None,
+        time_limit=None,
+        sample_size=None,
+        seed=None,
+        progress=None,
+        dispatch_orders=None,
+        run=True,
+    ):
+        """
+        Load Profit/Loss data from Cloud Commerce.
+
+        Args:
+            start: If not None only orders dispatched on or after this
+                datetime.date are included.
+            end: If not None only orders dispatched before this
+                datetime.date are included.
+            fetch_products: If False the third stage is skipped and the
+                products for each order are only loaded when a field
+                depending on them is accessed.
+            workers: The number of threads used to request products. If
+                None there is one for each request ccapi_limiter can allow
+                at once, so the limiter alone sets the concurrency.
+            cache: order_profit.cache.ProfitCache for product data and
+                exchange rates. Products with current cached data are not
+                requested from Cloud Commerce.
+            time_limit: If not None the maximum number of seconds for which
+                the run continues. Orders not priced in time are skipped.
+            sample_size: If not None the number of orders to sample. Orders
+                are stratified by country and shipping rule.
+            seed: Seed for the random number generator used to sample
+                orders, so that a sample can be repeated.
+            progress: If False progress is not printed to stderr.
+            dispatch_orders: If not None, dispatched orders already loaded
+                from Cloud Commerce covering at least the dates from start
+                to today. They are filtered by date rather than requested
+                again.
+            run: If False no orders are loaded until the stages are run by
+                calling OrderProfit.run or each stage's method.
+
+        """
+        self.deadline = None
+        if time_limit is not None:
+            self.deadline = time.monotonic() + time_limit
+        self.coverage = CoverageReport()
+        if workers is not None:
+            self.workers = workers
+        if progress is not None:
+            self.progress = progress
+        self.cache = cache
+        countries.set_cache(self.cache)
+        self.start = start
+        self.end = end
+        if self.start is not None:
+            self.number_of_days = (datetime.date.today() - self.start).days + 1
+        self.sample_size = sample_size
+        self.seed = seed
+        self.dispatch_orders = dispatch_orders
         self.products = {}
+        self.orders = []
+        self.valid_orders = []
+        self.invalid_orders = []
+        self.sample = None
+        self.estimate = None
+        self.index = ProfitIndex()
+        if run is True:
+            self.run(fetch_products=fetch_products)
+
+    def run(self, fetch_products=True):
+        """
+        Run every stage.
+
+        Args:
+            fetch_products: If False the third stage is skipped.
+
+        """
+        self.load_orders()
+        if fetch_products is True:
+            self.process_orders(self.select_orders())
+
+    def load_orders(self):
+        """Load and validate the orders (stages one and two)."""
+        self.courier_rules = self.get_courier_rules()
+        self.shipping_rules = ShippingRules()
         orders = self.filter_orders(self.get_orders())
-        self.orders = self.process_orders(orders)
+        self.orders = self.create_orders(orders)
+        self.valid_orders, self.invalid_orders = self.validate_orders(self.orders)
+
+    def select_orders(self):
+        """Return the orders to price, sampling them if a sample size is set."""
+        orders = self.priceable_orders()
+        if self.sample_size is not None:
+            orders = self.sample_orders(orders, self.sample_size)
+        return orders
+
+    def get_courier_rules(self):
+        """Return courier rules from Cloud Commerce."""
+        return ccapi_limiter.call(CCAPI.get_courier_rules)
 
     def get_orders(self):
         """Return dispatched orders from Cloud Commerce."""
-        return CCAPI.get_orders_for_dispatch(
-            order_type=1, number_of_days=self.number_of_days
+        if self.dispatch_orders is not None:
+            return self.dispatch_orders
+        return ccapi_limiter.call(
+            CCAPI.get_orders_for_dispatch,
+            order_type=1,
+            number_of_days=self.number_of_days,
         )
 
     def filter_orders(self, orders):
@@ -32,16 +192,214 @@ class OrderProfit:
         orders = [  # Filter resends
             order for order in orders if float(order.total_gross_gbp) > 0
         ]
+        if self.start is not None or self.end is not None:
+            orders = [order for order in orders if self.in_date_range(order)]
         return orders
 
-    def process_orders(self, orders):
+    def in_date_range(self, order):
+        """Return True if an order was dispatched between start and end."""
+        dispatch_date = order.dispatch_date
+        if isinstance(dispatch_date, datetime.datetime):
+            dispatch_date = dispatch_date.date()
+        if self.start is not None and dispatch_date < self.start:
+            return False
+        if self.end is not None and dispatch_date >= self.end:
+            return False
+        return True
+
+    def create_orders(self, orders):
         """Return list of orders as order_profit.order.Order."""
-        processed_orders = []
-        for i, order in enumerate(orders):
-            order = Order(self, order)
-            processed_orders.append(order)
-            print(
-                f"Processing order {order.order_id} ({i + 1} of {len(orders)})",
-                file=sys.stderr,
-            )
-        return processed_orders
+        return [Order(self, order) for order in orders]
+
+    def validate_orders(self, orders):
+        """
+        Validate orders without loading their products.
+
+        Orders which fail validation are marked as errors.
+
+        Returns:
+            Tuple of (valid orders, invalid orders).
+
+        """
+        valid_orders = []
+        invalid_orders = []
+        for order in orders:
+            try:
+                order.validate()
+            except Exception as e:
+                invalid_orders.append(order)
+                self.coverage.skip(
+                    order, CoverageReport.INVALID.format(type(e).__name__)
+                )
+            else:
+                valid_orders.append(order)
+        return valid_orders, invalid_orders
+
+    def priceable_orders(self):
+        """Return valid orders sent with a valid shipping service."""
+        orders = []
+        for order in self.valid_orders:
+            if order.courier.is_valid_service is True:
+                orders.append(order)
+            else:
+                self.coverage.skip(order, CoverageReport.INVALID_SERVICE)
+        return orders
+
+    def sample_orders(self, orders, sample_size):
+        """Return a stratified sample of orders, skipping the others."""
+        self.sample = StratifiedSample(orders, sample_size, seed=self.seed)
+        sampled = self.sample.orders
+        sampled_ids = set(order.order_id for order in sampled)
+        for order in orders:
+            if order.order_id not in sampled_ids:
+                self.coverage.skip(order, CoverageReport.NOT_SAMPLED)
+        return sampled
+
+    def time_remaining(self):
+        """Return the number of seconds until the deadline, or None."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def deadline_passed(self):
+        """Return True if the run's deadline has passed."""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def product_loaded(self, product_id):
+        """Return True if a product is loaded or cached."""
+        if product_id in self.products:
+            return True
+        return self.cache is not None and self.cache.has_product(product_id)
+
+    def products_to_load(self, order):
+        """Return the IDs of products in an order which are not loaded."""
+        return set(
+            product.product_id
+            for product in order.dispatch_order.products
+            if not self.product_loaded(product.product_id)
+        )
+
+    def prioritise_orders(self, orders):
+        """Return orders sorted by the number of products they need loaded."""
+        return sorted(orders, key=lambda order: len(self.products_to_load(order)))
+
+    def load_products(self, product_ids):
+        """
+        Request products from Cloud Commerce.
+
+        Products are requested in the order given. Requests not started by
+        the deadline are cancelled, and threads waiting for the limiter
+        give up at the deadline, so only requests already running continue
+        after it.
+
+        Args:
+            product_ids: Dict of IDs of the products to load to their SKUs.
+
+        Yields:
+            The ID of each product as it is loaded.
+
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers or ccapi_limiter.maximum)
+        futures = {
+            executor.submit(
+                Product.fetch_product, product_id, sku, deadline=self.deadline
+            ): product_id
+            for product_id, sku in product_ids.items()
+        }
+        try:
+            for future in as_completed(futures, timeout=self.time_remaining()):
+                try:
+                    self.products[futures[future]] = future.result()
+                except Exception as e:
+                    logger.exception(e)
+                else:
+                    yield futures[future]
+        except TimeoutError:
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=self.deadline is None)
+            logger.info(f"Cloud Commerce requests: {ccapi_limiter.metrics()}")
+
+    def process_orders(self, orders):
+        """
+        Load the products for, and calculate the profit of, orders.
+
+        Returns:
+            List of the orders priced successfully.
+
+        """
+        for order in self.price_orders(orders):
+            pass
+        if self.sample is not None:
+            self.estimate = self.sample.estimate(self.coverage.completed)
+        return self.coverage.completed
+
+    def price_orders(self, orders):
+        """
+        Load the products for, and calculate the profit of, orders (stage 3).
+
+        Each order is priced as soon as all of its products are loaded.
+        References to orders are dropped as they are priced or skipped, so
+        a caller which does not keep them can release each order once it
+        has been used.
+
+        Yields:
+            Each order priced successfully.
+
+        """
+        orders = deque(self.prioritise_orders(orders))
+        waiting = {}
+        product_ids = {}
+        while orders:
+            order = orders.popleft()
+            missing = self.products_to_load(order)
+            if not missing:
+                if self.price_order(order) is True:
+                    yield order
+                continue
+            waiting[order.order_id] = (order, missing)
+            for product in order.dispatch_order.products:
+                if product.product_id in missing:
+                    product_ids[product.product_id] = product.sku
+        waiting_on = {}
+        for order, missing in waiting.values():
+            for product_id in missing:
+                waiting_on.setdefault(product_id, []).append(order)
+        for product_id in self.load_products(product_ids):
+            for order in waiting_on.pop(product_id, []):
+                missing = waiting[order.order_id][1]
+                missing.discard(product_id)
+                if not missing:
+                    del waiting[order.order_id]
+                    if self.price_order(order) is True:
+                        yield order
+        for order, missing in waiting.values():
+            if self.deadline_passed():
+                self.coverage.deadline_exceeded = True
+                self.coverage.skip(order, CoverageReport.DEADLINE)
+            else:
+                self.coverage.skip(order, CoverageReport.PRODUCTS_NOT_LOADED)
+
+    def price_order(self, order):
+        """
+        Calculate the profit of an order unless the deadline has passed.
+
+        Returns:
+            True if the order was priced successfully.
+
+        """
+        if self.deadline_passed():
+            self.coverage.deadline_exceeded = True
+            self.coverage.skip(order, CoverageReport.DEADLINE)
+            return False
+        if self.progress is True:
+            print(f"Processing order {order.order_id}", file=sys.stderr)
+        if order.error is True:
+            self.coverage.skip(order, CoverageReport.ERROR)
+            return False
+        self.coverage.complete(order)
+        if self.index is not None:
+            self.index.add(order)
+        return True
@@ -1,9 +1,13 @@
 """The Product class."""
 
 import time
+from functools import cached_property
 
 from ccapi import CCAPI
 
+from . import exceptions
+from .concurrency import ccapi_limiter
+
 
 class Product:
     """
@@ -15,6 +19,7 @@ class Product:
         sku: The SKU of the product.
         quantity: The quantity of this product ordered.
         inventory_product: ccapi.inventory_items.Product for this product.
+            Only requested if the product's data is not in update.cache.
         weight: The weight of the product.
         purchase_price: The products Purchase Price in GBP pence.
         department: The department to which the product belongs.
@@ -37,14 +42,49 @@ class Product:
         self.order_product = order_product
         self.sku = self.order_product.sku
         self.quantity = self.order_product.quantity
-        self.inventory_product = self.get_product()
         self.weight = self.order_product.per_item_weight
-        self.purchase_price = self.calculate_purchase_price()
-        self.department = self.inventory_product.options["Department"].value.value
-        self.vat_rate = self.get_vat_rate()
-        self.product_id = self.inventory_product.id
-        self.range_id = self.inventory_product.range_id
-        self.name = self.inventory_product.full_name
+        product_data = self.get_product_data()
+        self.purchase_price = product_data["purchase_price"]
+        self.department = product_data["department"]
+        self.vat_rate = product_data["vat_rate"]
+        self.product_id = product_data["product_id"]
+        self.range_id = product_data["range_id"]
+        self.name = product_data["name"]
+
+    @cached_property
+    def inventory_product(self):
+        """Return ccapi.inventory_items.Product for this product."""
+        return self.get_product()
+
+    def get_product_data(self):
+        """
+        Return dict of the product's inventory data.
+
+        Data is loaded from update.cache if it is available and current,
+        otherwise it is loaded from Cloud Commerce and added to the cache.
+
+        """
+        cache = self.update.cache
+        product_id = self.order_product.product_id
+        if cache is not None:
+            product_data = cache.get_product(product_id)
+            if product_data is not None:
+                return product_data
+        product_data = self.load_product_data()
+        if cache is not None:
+            cache.set_product(product_id, product_data)
+        return product_data
+
+    def load_product_data(self):
+        """Return dict of the product's inventory data from Cloud Commerce."""
+        return {
+            "purchase_price": self.calculate_purchase_price(),
+            "department": self.inventory_product.options["Department"].value.value,
+            "vat_rate": self.get_vat_rate(),
+            "product_id": self.inventory_product.id,
+            "range_id": self.inventory_product.range_id,
+            "name": self.inventory_product.full_name,
+        }
 
     def get_vat_rate(self):
         """Return the product's UK VAT rate."""
@@ -71,18 +111,52 @@ class Product:
             ccapi.inventory_items.Product.
 
         """
-        if self.order_product.product_id in self.update.products:
-            return self.update.products[self.order_product.product_id]
+        product_id = self.order_product.product_id
+        if product_id not in self.update.products:
+            self.update.products[product_id] = self.fetch_product(
+                product_id, self.sku, deadline=self.update.deadline
+            )
+        return self.update.products[product_id]
+
+    @staticmethod
+    def fetch_product(product_id, sku, deadline=None):
+        """
+        Request product inventory data from Cloud Commerce.
+
+        Requests are made through order_profit.concurrency.ccapi_limiter and
+        retried on failure. No request is started after the deadline,
+        including while waiting for the limiter.
+
+        Args:
+            product_id: The ID of the product.
+            sku: The SKU of the product.
+            deadline: If not None, the time.monotonic() time after which no
+                further attempts are made.
+
+        Returns:
+            ccapi.inventory_items.Product.
+
+        Raises:
+            order_profit.exceptions.DeadlineExceeded: If the product cannot
+                be loaded before the deadline.
+
+        """
         for attempt in range(100):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise exceptions.DeadlineExceeded(sku)
             try:
-                return CCAPI.get_product(self.order_product.product_id)
+                return ccapi_limiter.call_until(deadline, CCAPI.get_product, product_id)
+            except exceptions.LimiterTimeout:
+                raise exceptions.DeadlineExceeded(sku)
             except Exception:
+                if deadline is not None and time.monotonic() + 10 > deadline:
+                    raise exceptions.DeadlineExceeded(sku)
                 time.sleep(10)
                 continue
             else:
                 break
         else:
-            raise Exception("Unable to load product {}.".format(self.order_product.sku))
+            raise Exception("Unable to load product {}.".format(sku))
 
     def calculate_purchase_price(self):
         """Return the purchase price of the product."""
@@ -0,0 +1,279 @@
+"""Estimate Profit/Loss totals from a stratified sample of orders."""
+
+import math
+import random
+
+
+def stratum(order):
+    """
+    Return the stratum to which an order belongs.
+
+    Orders are stratified by destination country and shipping rule, both of
+    which are known without loading the order's products.
+
+    """
+    return (order.country.name, order.courier.name)
+
+
+class Estimate:
+    """
+    An estimated total with its standard error.
+
+    Attributes:
+        value: The estimated value.
+        standard_error: The standard error of the estimate.
+
+    """
+
+    def __init__(self, value, standard_error):
+        """
+        Create an estimate.
+
+        Args:
+            value: The estimated value.
+            standard_error: The standard error of the estimate.
+
+        """
+        self.value = value
+        self.standard_error = standard_error
+
+    def __repr__(self):
+        low, high = self.interval()
+        return f"{self.value:.2f} ({low:.2f} to {high:.2f})"
+
+    def interval(self, z=1.96):
+        """
+        Return the confidence interval for the estimate.
+
+        Args:
+            z: The number of standard errors either side of the estimate.
+                The default of 1.96 gives a 95% confidence interval.
+
+        Returns:
+            Tuple of (low, high).
+
+        """
+        margin = z * self.standard_error
+        return (self.value - margin, self.value + margin)
+
+
+class ProfitEstimate:
+    """
+    Estimated Profit/Loss totals for a population of orders.
+
+    Totals are in GBP pence.
+
+    Attributes:
+        price: order_profit.sampling.Estimate of the total order price.
+        purchase_price: Estimate of the total purchase price.
+        postage_price: Estimate of the total postage price.
+        channel_fee: Estimate of the total channel fee.
+        profit: Estimate of the total profit before VAT.
+        margin: Estimate of total profit as a proportion of total price.
+        population: The number of orders in the population.
+        priced: The number of sampled orders priced successfully.
+        unestimated: The number of orders in strata in which no sampled
+            order could be priced. These are not included in the totals.
+
+    """
+
+    TOTALS = ("price", "purchase_price", "postage_price", "channel_fee", "profit")
+
+    def __init__(self, strata):
+        """
+        Calculate estimates from sampled strata.
+
+        Args:
+            strata: List of tuples of (population size, priced orders) for
+                each stratum.
+
+        """
+        self.population = sum(size for size, _ in strata)
+        self.priced = sum(len(orders) for _, orders in strata)
+        self.unestimated = sum(size for size, orders in strata if not orders)
+        strata = [(size, orders) for size, orders in strata if orders]
+        for total in self.TOTALS:
+            values = [
+                (size, [getattr(order, total) for order in orders])
+                for size, orders in strata
+            ]
+            setattr(self, total, self.estimate_total(values))
+        self.margin = self.estimate_ratio(strata)
+
+    @staticmethod
+    def variance(values):
+        """Return the sample variance of values, or 0 for fewer than two."""
+        if len(values) < 2:
+            return 0
+        mean = sum(values) / len(values)
+        return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+    @classmethod
+    def total_variance(cls, size, values):
+        """Return the variance of a stratum's estimated total."""
+        sample_size = len(values)
+        correction = 1 - sample_size / size
+        return size ** 2 * correction * cls.variance(values) / sample_size
+
+    @classmethod
+    def estimate_total(cls, strata):
+        """
+        Return the stratified estimate of a population total.
+
+        Args:
+            strata: List of tuples of (population size, sampled values).
+
+        """
+        value = sum(size * sum(values) / len(values) for size, values in strata)
+        variance = sum(cls.total_variance(size, values) for size, values in strata)
+        return Estimate(value, math.sqrt(variance))
+
+    @classmethod
+    def estimate_ratio(cls, strata):
+        """
+        Return the combined ratio estimate of total profit to total price.
+
+        Args:
+            strata: List of tuples of (population size, priced orders).
+
+        """
+        price = sum(
+            size * sum(o.price for o in orders) / len(orders) for size, orders in strata
+        )
+        profit = sum(
+            size * sum(o.profit for o in orders) / len(orders)
+            for size, orders in strata
+        )
+        if price == 0:
+            return Estimate(0, 0)
+        ratio = profit / price
+        variance = sum(
+            cls.total_variance(size, [o.profit - ratio * o.price for o in orders])
+            for size, orders in strata
+        )
+        return Estimate(ratio, math.sqrt(variance) / price)
+
+
+class StratifiedSample:
+    """
+    A stratified random sample of orders.
+
+    The sample is allocated to strata in proportion to their size, with
+    remainders going to the strata with the largest fractional share, so
+    exactly sample_size orders are sampled. Strata whose share is smaller
+    than StratifiedSample.MINIMUM_PER_STRATUM are pooled into a single
+    StratifiedSample.POOLED stratum, so that the cost of the sample does
+    not grow with the number of strata. The pooled stratum is given at
+    least StratifiedSample.MINIMUM_PER_STRATUM orders, taken from the
+    largest strata, so that the variance of every stratum can be
+    estimated where the sample size allows.
+
+    When the sample is small compared to the number of strata every
+    stratum may be pooled, in which case the sample is a simple random
+    sample with no stratification.
+
+    Attributes:
+        strata: Dict of strata to the list of orders in each.
+        samples: Dict of strata to the list of orders sampled from each.
+
+    """
+
+    MINIMUM_PER_STRATUM = 2
+    POOLED = "Pooled"
+
+    def __init__(self, orders, sample_size, key=stratum, seed=None):
+        """
+        Select a sample of orders.
+
+        Args:
+            orders: The orders from which to sample.
+            sample_size: The number of orders to sample.
+            key: Callable returning the stratum of an order.
+            seed: Seed for the random number generator.
+
+        """
+        strata = {}
+        for order in orders:
+            strata.setdefault(key(order), []).append(order)
+        population = sum(len(orders) for orders in strata.values())
+        sample_size = min(sample_size, population)
+        self.strata = {}
+        for name, stratum_orders in strata.items():
+            share = sample_size * len(stratum_orders) / population
+            if share < self.MINIMUM_PER_STRATUM:
+                name = self.POOLED
+            self.strata.setdefault(name, []).extend(stratum_orders)
+        rng = random.Random(seed)
+        self.samples = {}
+        allocations = self.allocate(sample_size, population)
+        for name, stratum_orders in self.strata.items():
+            self.samples[name] = rng.sample(stratum_orders, allocations[name])
+
+    def allocate(self, sample_size, population):
+        """
+        Return dict of strata to the number of orders to sample from each.
+
+        Allocations are proportional to stratum size and sum to sample_size,
+        except that the pooled stratum is topped up to
+        StratifiedSample.MINIMUM_PER_STRATUM orders from the strata with the
+        largest allocations.
+
+        """
+        shares = {
+            name: sample_size * len(orders) / population
+            for name, orders in self.strata.items()
+        }
+        allocations = {name: int(share) for name, share in shares.items()}
+        remainder = sample_size - sum(allocations.values())
+        by_fraction = sorted(
+            shares, key=lambda name: shares[name] - allocations[name], reverse=True
+        )
+        for name in by_fraction[:remainder]:
+            allocations[name] += 1
+        if self.POOLED in self.strata:
+            minimum = min(self.MINIMUM_PER_STRATUM, len(self.strata[self.POOLED]))
+            while allocations[self.POOLED] < minimum:
+                donors = [
+                    name
+                    for name, allocation in allocations.items()
+                    if name != self.POOLED and allocation > self.MINIMUM_PER_STRATUM
+                ]
+                if not donors:
+                    break
+                donor = max(donors, key=lambda name: allocations[name])
+                allocations[donor] -= 1
+                allocations[self.POOLED] += 1
+        return allocations
+
+    @property
+    def size(self):
+        """Return the number of orders sampled."""
+        return sum(len(orders) for orders in self.samples.values())
+
+    @property
+    def orders(self):
+        """Return list of all sampled orders."""
+        return [order for orders in self.samples.values() for order in orders]
+
+    def estimate(self, priced_orders):
+        """
+        Return estimated totals for every order in the strata.
+
+        Args:
+            priced_orders: The sampled orders priced successfully. Other
+                sampled orders are treated as missing from the sample.
+
+        Returns:
+            order_profit.sampling.ProfitEstimate.
+
+        """
+        priced = set(order.order_id for order in priced_orders)
+        return ProfitEstimate(
+            [
+                (
+                    len(self.strata[name]),
+                    [order for order in sample if order.order_id in priced],
+                )
+                for name, sample in self.samples.items()
+            ]
+        )
@@ -341,6 +341,22 @@ class ShippingRules:
             for cls in all_subclasses(ShippingRule)
             if len(cls.__subclasses__()) == 0
         ]
+        self.rule_index = self.index_rules(self.shipping_rules)
+
+    @staticmethod
+    def index_rules(shipping_rules):
+        """
+        Return dict of Cloud Commerce Shipping Rule IDs to candidate rules.
+
+        Rules that match any rule ID are indexed under None and included in
+        the candidates for every rule ID.
+
+        """
+        index = {None: [r for r in shipping_rules if r.rule_ids is None]}
+        for rule in shipping_rules:
+            for rule_id in rule.rule_ids or []:
+                index.setdefault(rule_id, []).append(rule)
+        return index
 
     def get_shipping_rules(self, country_id, rule_id):
         """
@@ -351,7 +367,8 @@ class ShippingRules:
             rule_id: The shipping rule applied to the order.
 
         """
-        return [r for r in self.shipping_rules if r.matches(country_id, rule_id)]
+        candidates = self.rule_index.get(int(rule_id), []) + self.rule_index[None]
+        return [r for r in candidates if r.matches(country_id, rule_id)]
 
     def get_shipping_rule(self, country_id, rule_id):
         """
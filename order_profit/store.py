@@ -0,0 +1,392 @@
+"""Local storage for historical Profit/Loss data."""
+
+import sqlite3
+
+
+class ProfitStore:
+    """
+    SQLite store of per order and per product Profit/Loss data.
+
+    Orders are stored once per order ID. Storing an order again replaces
+    the existing rows for it, so overlapping runs can be stored safely.
+
+    Attributes:
+        path: The path to the SQLite database file.
+        connection: sqlite3.Connection to the database.
+
+    """
+
+    ORDER_COLUMNS = (
+        "order_id",
+        "customer_id",
+        "date_recieved",
+        "dispatch_date",
+        "country_id",
+        "country",
+        "department",
+        "courier",
+        "weight",
+        "item_count",
+        "vat_rate",
+        "price",
+        "purchase_price",
+        "postage_price",
+        "channel_fee",
+        "profit",
+        "vat",
+        "profit_vat",
+    )
+    PRODUCT_COLUMNS = (
+        "order_id",
+        "product_id",
+        "range_id",
+        "sku",
+        "name",
+        "department",
+        "quantity",
+        "purchase_price",
+        "vat_rate",
+    )
+    TOTAL_COLUMNS = (
+        "price",
+        "purchase_price",
+        "postage_price",
+        "channel_fee",
+        "profit",
+        "vat",
+        "profit_vat",
+    )
+    GROUP_BY_COLUMNS = ("dispatch_date", "department", "country", "courier")
+    PRODUCT_GROUP_BY_COLUMNS = ("sku", "product_id", "range_id", "department")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id INTEGER PRIMARY KEY,
+            customer_id INTEGER,
+            date_recieved TEXT,
+            dispatch_date TEXT,
+            country_id INTEGER,
+            country TEXT,
+            department TEXT,
+            courier TEXT,
+            weight INTEGER,
+            item_count INTEGER,
+            vat_rate INTEGER,
+            price INTEGER,
+            purchase_price INTEGER,
+            postage_price INTEGER,
+            channel_fee INTEGER,
+            profit INTEGER,
+            vat INTEGER,
+            profit_vat INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS products (
+            order_id INTEGER NOT NULL
+                REFERENCES orders (order_id) ON DELETE CASCADE,
+            product_id TEXT,
+            range_id TEXT,
+            sku TEXT,
+            name TEXT,
+            department TEXT,
+            quantity INTEGER,
+            purchase_price INTEGER,
+            vat_rate INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS orders_dispatch_date
+            ON orders (dispatch_date);
+        CREATE INDEX IF NOT EXISTS orders_department ON orders (department);
+        CREATE INDEX IF NOT EXISTS orders_country ON orders (country);
+        CREATE INDEX IF NOT EXISTS orders_courier ON orders (courier);
+        CREATE INDEX IF NOT EXISTS products_order_id ON products (order_id);
+        CREATE INDEX IF NOT EXISTS products_sku ON products (sku);
+        CREATE INDEX IF NOT EXISTS products_product_id ON products (product_id);
+        CREATE INDEX IF NOT EXISTS products_range_id ON products (range_id);
+    """
+
+    def __init__(self, path):
+        """
+        Open the store, creating it if it does not exist.
+
+        Args:
+            path: The path to the SQLite database file.
+
+        """
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the connection to the database."""
+        self.connection.close()
+
+    def add(self, order_profit):
+        """
+        Store the orders priced by an order_profit.OrderProfit run.
+
+        Only the orders in the run's coverage report are stored, so the
+        run must keep its completed orders.
+
+        Returns:
+            The number of orders stored.
+
+        """
+        return self.add_orders(order_profit.coverage.completed)
+
+    def add_orders(self, orders):
+        """
+        Store orders as order_profit.order.Order.
+
+        Orders which have not been priced successfully, including those
+        skipped by the run, are not stored and are not priced here.
+
+        Returns:
+            The number of orders stored.
+
+        """
+        count = 0
+        with self.connection:
+            for order in orders:
+                if order.priced is not True:
+                    continue
+                self.add_order(order)
+                count += 1
+        return count
+
+    def add_order(self, order):
+        """Store a single order, replacing any existing rows for it."""
+        self.connection.execute(
+            "DELETE FROM orders WHERE order_id = ?", (order.order_id,)
+        )
+        self.insert("orders", self.ORDER_COLUMNS, self.order_row(order))
+        for product in order.products:
+            self.insert(
+                "products",
+                self.PRODUCT_COLUMNS,
+                self.product_row(order, product),
+            )
+
+    def merge(self, path):
+        """
+        Copy the orders stored in another ProfitStore database into this one.
+
+        Orders already in this store are replaced.
+
+        Args:
+            path: The path to the SQLite database file to merge.
+
+        Returns:
+            The number of orders merged.
+
+        """
+        self.connection.execute("ATTACH DATABASE ? AS other", (str(path),))
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM products WHERE order_id IN "
+                    "(SELECT order_id FROM other.orders)"
+                )
+                count = self.connection.execute(
+                    "INSERT OR REPLACE INTO orders SELECT * FROM other.orders"
+                ).rowcount
+                self.connection.execute(
+                    "INSERT INTO products SELECT * FROM other.products"
+                )
+        finally:
+            self.connection.execute("DETACH DATABASE other")
+        return count
+
+    def insert(self, table, columns, row):
+        """Insert a row into a table."""
+        self.connection.execute(
+            "INSERT INTO {} ({}) VALUES ({})".format(
+                table, ", ".join(columns), ", ".join("?" for _ in columns)
+            ),
+            [row[column] for column in columns],
+        )
+
+    @staticmethod
+    def format_date(date):
+        """Return a date as an ISO 8601 string."""
+        if date is None:
+            return None
+        if hasattr(date, "isoformat"):
+            return date.isoformat()
+        return str(date)
+
+    @classmethod
+    def order_row(cls, order):
+        """Return a dict of the stored values for an order."""
+        return {
+            "order_id": order.order_id,
+            "customer_id": order.customer_id,
+            "date_recieved": cls.format_date(order.date_recieved),
+            "dispatch_date": cls.format_date(order.dispatch_date),
+            "country_id": order.country.id,
+            "country": order.country.name,
+            "department": order.department,
+            "courier": order.courier.name,
+            "weight": order.weight,
+            "item_count": order.item_count,
+            "vat_rate": order.vat_rate,
+            "price": order.price,
+            "purchase_price": order.purchase_price,
+            "postage_price": order.postage_price,
+            "channel_fee": order.channel_fee,
+            "profit": order.profit,
+            "vat": order.vat,
+            "profit_vat": order.profit_vat,
+        }
+
+    @staticmethod
+    def product_row(order, product):
+        """Return a dict of the stored values for a product in an order."""
+        return {
+            "order_id": order.order_id,
+            "product_id": product.product_id,
+            "range_id": product.range_id,
+            "sku": product.sku,
+            "name": product.name,
+            "department": product.department,
+            "quantity": product.quantity,
+            "purchase_price": product.purchase_price,
+            "vat_rate": product.vat_rate,
+        }
+
+    def where(self, start=None, end=None, table="orders", **filters):
+        """
+        Return an SQL WHERE clause and its parameters.
+
+        Args:
+            start: Include orders dispatched on or after this date.
+            end: Include orders dispatched before this date.
+            table: The table to which the filters apply.
+            **filters: Column names and the values they must equal.
+
+        """
+        columns = self.ORDER_COLUMNS if table == "orders" else self.PRODUCT_COLUMNS
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("orders.dispatch_date >= ?")
+            params.append(self.format_date(start))
+        if end is not None:
+            clauses.append("orders.dispatch_date < ?")
+            params.append(self.format_date(end))
+        for column, value in filters.items():
+            if column not in columns:
+                raise ValueError(f"Cannot filter {table} by {column}.")
+            clauses.append(f"{table}.{column} = ?")
+            params.append(value)
+        if not clauses:
+            return "", params
+        return "WHERE " + " AND ".join(clauses), params
+
+    def query(self, sql, params=()):
+        """Return the results of an SQL query as a list of dicts."""
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def orders(self, start=None, end=None, **filters):
+        """
+        Return stored orders as dicts.
+
+        Args:
+            start: Include orders dispatched on or after this date.
+            end: Include orders dispatched before this date.
+            **filters: Order columns and the values they must equal, eg.
+                department="Beauty" or country="France".
+
+        """
+        where, params = self.where(start, end, **filters)
+        return self.query(
+            f"SELECT * FROM orders {where} ORDER BY orders.dispatch_date", params
+        )
+
+    def products(self, start=None, end=None, **filters):
+        """
+        Return stored products as dicts.
+
+        Args:
+            start: Include products from orders dispatched on or after this
+                date.
+            end: Include products from orders dispatched before this date.
+            **filters: Product columns and the values they must equal, eg.
+                sku="ABC-123-XYZ".
+
+        """
+        where, params = self.where(start, end, table="products", **filters)
+        return self.query(
+            "SELECT products.*, orders.dispatch_date FROM products "
+            f"JOIN orders USING (order_id) {where} "
+            "ORDER BY orders.dispatch_date",
+            params,
+        )
+
+    def group_by(self, column, start=None, end=None, **filters):
+        """
+        Return order totals grouped by a column.
+
+        Args:
+            column: The column by which to group orders. One of
+                ProfitStore.GROUP_BY_COLUMNS. Orders grouped by
+                dispatch_date are grouped by day.
+            start: Include orders dispatched on or after this date.
+            end: Include orders dispatched before this date.
+            **filters: Order columns and the values they must equal.
+
+        Returns:
+            List of dicts containing the group, order_count and the total of
+            each of ProfitStore.TOTAL_COLUMNS.
+
+        """
+        if column not in self.GROUP_BY_COLUMNS:
+            raise ValueError(f"Cannot group orders by {column}.")
+        group = f"orders.{column}"
+        if column == "dispatch_date":
+            group = "substr(orders.dispatch_date, 1, 10)"
+        totals = ", ".join(
+            f"SUM(orders.{total}) AS {total}" for total in self.TOTAL_COLUMNS
+        )
+        where, params = self.where(start, end, **filters)
+        return self.query(
+            f"SELECT {group} AS {column}, COUNT(*) AS order_count, {totals} "
+            f"FROM orders {where} GROUP BY {group} ORDER BY {group}",
+            params,
+        )
+
+    def group_products_by(self, column, start=None, end=None, **filters):
+        """
+        Return product totals grouped by a column.
+
+        Args:
+            column: The column by which to group products. One of
+                ProfitStore.PRODUCT_GROUP_BY_COLUMNS.
+            start: Include products from orders dispatched on or after this
+                date.
+            end: Include products from orders dispatched before this date.
+            **filters: Product columns and the values they must equal.
+
+        Returns:
+            List of dicts containing the group, order_count, quantity and
+            purchase_price, the total cost of the items.
+
+        """
+        if column not in self.PRODUCT_GROUP_BY_COLUMNS:
+            raise ValueError(f"Cannot group products by {column}.")
+        where, params = self.where(start, end, table="products", **filters)
+        return self.query(
+            f"SELECT products.{column} AS {column}, "
+            "COUNT(DISTINCT products.order_id) AS order_count, "
+            "SUM(products.quantity) AS quantity, "
+            "SUM(products.purchase_price * products.quantity) AS purchase_price "
+            f"FROM products JOIN orders USING (order_id) {where} "
+            f"GROUP BY products.{column} ORDER BY products.{column}",
+            params,
+        )
@@ -0,0 +1,59 @@
+import math
+import random
+
+from order_profit.concurrency import AdaptiveLimiter
+
+
+def saturated_request(limiter, latency, error=False, endpoint="get_product"):
+    with limiter.condition:
+        limiter.in_flight = int(limiter.limit)
+    limiter.record(latency, error=error, endpoint=endpoint)
+    with limiter.condition:
+        limiter.in_flight = 0
+
+
+def jittery_latency(rng, median=0.1):
+    return rng.lognormvariate(math.log(median), 0.3)
+
+
+def test_limit_grows_with_jittery_healthy_latency():
+    limiter = AdaptiveLimiter(initial=4, maximum=32)
+    rng = random.Random(0)
+    for _ in range(1500):
+        saturated_request(limiter, jittery_latency(rng))
+    assert limiter.limit == 32
+    assert limiter.errors == 0
+
+
+def test_fast_endpoints_do_not_make_slower_endpoints_slow():
+    limiter = AdaptiveLimiter(initial=4, maximum=32)
+    rng = random.Random(1)
+    for _ in range(20):
+        saturated_request(limiter, 0.000006, endpoint="get_courier_rules")
+    for _ in range(500):
+        saturated_request(limiter, jittery_latency(rng))
+    assert limiter.limit == 32
+
+
+def test_limit_does_not_grow_when_unused():
+    limiter = AdaptiveLimiter(initial=4, maximum=32)
+    for _ in range(500):
+        limiter.record(0.1, endpoint="get_product")
+    assert limiter.limit == 4
+
+
+def test_sustained_latency_increase_decreases_limit():
+    limiter = AdaptiveLimiter(initial=4, maximum=32)
+    rng = random.Random(2)
+    for _ in range(1500):
+        saturated_request(limiter, jittery_latency(rng))
+    limiter.last_decrease = 0
+    for _ in range(20):
+        saturated_request(limiter, jittery_latency(rng, median=1))
+    assert limiter.limit < 32
+
+
+def test_errors_decrease_limit():
+    limiter = AdaptiveLimiter(initial=8)
+    saturated_request(limiter, 0.1, error=True)
+    assert limiter.limit == 4
@@ -0,0 +1,36 @@
+import time
+
+from ccapi import CCAPI
+
+from order_profit import differential, product
+from order_profit.concurrency import AdaptiveLimiter
+
+
+def test_no_product_requests_start_after_deadline(monkeypatch):
+    harness = differential.Harness(size=200, seed=1)
+    started = []
+
+    def get_product(product_id):
+        started.append(time.monotonic())
+        time.sleep(0.05)
+        return harness.products[product_id]
+
+    monkeypatch.setattr(CCAPI, "get_product", get_product, raising=False)
+    monkeypatch.setattr(product, "ccapi_limiter", AdaptiveLimiter(initial=4, maximum=4))
+    saved_rates = harness.set_currency_rates()
+    try:
+        order_profit = differential.HarnessOrderProfit(harness, harness.population)
+        order_profit.products.clear()
+        order_profit.load_orders()
+        order_profit.deadline = time.monotonic() + 0.3
+        order_profit.process_orders(order_profit.select_orders())
+        returned = time.monotonic()
+        requests = len(started)
+        time.sleep(0.2)
+    finally:
+        harness.restore_currency_rates(saved_rates)
+    assert order_profit.coverage.deadline_exceeded is True
+    assert 0 < requests < len(harness.products)
+    assert len(started) == requests
+    assert all(start < order_profit.deadline for start in started)
+    assert returned - order_profit.deadline < 0.1
@@ -0,0 +1,46 @@
+import pytest
+
+from order_profit import differential, shipping
+from order_profit.countries import countries
+
+
+@pytest.mark.parametrize("path", list(differential.FAST_PATHS))
+def test_fast_path_matches_reference(path):
+    (result,) = differential.run(size=500, seed=1, paths=[path])
+    assert result.mismatch is None, repr(result.mismatch)
+
+
+def test_main_returns_zero_without_mismatches():
+    assert differential.main(["--size", "100", "--seed", "2"]) == 0
+
+
+def test_population_covers_every_rule_and_country():
+    harness = differential.Harness(size=0)
+    covered = set()
+    for dispatch_order in harness.population:
+        rule_id = int(dispatch_order.default_cs_rule_name.split(" ")[1])
+        for rule in harness.shipping_rules.shipping_rules:
+            if rule.rule_ids is None or rule_id in rule.rule_ids:
+                covered.add((rule.name, dispatch_order.delivery_country_code))
+    assert covered >= set(
+        (rule.name, country.id)
+        for rule in harness.shipping_rules.shipping_rules
+        for country in countries
+    )
+
+
+@pytest.mark.parametrize("path", list(differential.FAST_PATHS))
+def test_invalid_service_orders_match_reference(monkeypatch, path):
+    # ErrorShippingRule has no country IDs so never matches an order.
+    monkeypatch.setattr(shipping.ErrorShippingRule, "country_ids", None)
+    harness = differential.Harness(size=0)
+    saved_rates = harness.set_currency_rates()
+    try:
+        reference = differential.reference_orders_path(harness, harness.population)
+        assert any(
+            result.get("is_valid_service") is False for result in reference.values()
+        )
+        found = differential.find_mismatch(harness, path, harness.population, reference)
+    finally:
+        harness.restore_currency_rates(saved_rates)
+    assert found is None
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+from order_profit.index import ProfitIndex
+
+
+def line_item(product_id, quantity, purchase_price):
+    return SimpleNamespace(
+        product_id=product_id,
+        range_id=f"R{product_id}",
+        sku=f"SKU-{product_id}",
+        quantity=quantity,
+        purchase_price=purchase_price,
+    )
+
+
+def order(order_id, profit, products):
+    return SimpleNamespace(order_id=order_id, profit=profit, products=products)
+
+
+def test_profit_is_allocated_by_value():
+    index = ProfitIndex([order(1, 100, [line_item(1, 1, 300), line_item(2, 1, 100)])])
+    assert index.product_profit(1) == 75
+    assert index.product_profit(2) == 25
+
+
+def test_profit_is_allocated_by_quantity_without_value():
+    index = ProfitIndex([order(1, -90, [line_item(1, 2, 0), line_item(2, 1, 0)])])
+    assert index.product_profit(1) == -60
+    assert index.product_profit(2) == -30
+
+
+@pytest.mark.parametrize("products", [[], [line_item(1, 0, 0), line_item(2, 0, 100)]])
+def test_order_without_allocation_is_indexed_without_rows(products):
+    index = ProfitIndex([order(1, 100, products)])
+    assert 1 in index
+    assert index.products == {}
+    assert index.product_totals == {}
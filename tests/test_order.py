@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+import pytest
+
+from order_profit import differential, shipping
+from order_profit.countries import countries
+from order_profit.order import Order
+
+
+def test_unpriceable_postage_fails_validation_without_loading_products():
+    harness = differential.Harness(size=0)
+    rule = shipping.SecuredMailInternationalTracked
+    country = next(c for c in countries if rule.service not in c.services)
+    dispatch_order = SimpleNamespace(
+        order_id="1",
+        customer_id="1",
+        date_recieved=None,
+        dispatch_date=None,
+        delivery_country_code=country.id,
+        total_gross_gbp="10.00",
+        default_cs_rule_name=(
+            f"{harness.courier_rule_name(rule.rule_ids[0])} - Service"
+        ),
+        products=[harness.order_product()],
+    )
+    order = Order(harness, dispatch_order)
+    with pytest.raises(Exception, match=rule.service):
+        order.validate()
+    assert order.courier.name == rule.name
+    assert order.products == []
+    assert order.error is True
+    assert order.postage_price is None
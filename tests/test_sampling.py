@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from order_profit.sampling import StratifiedSample
+
+
+def population(sizes):
+    orders = []
+    for stratum, size in enumerate(sizes):
+        for _ in range(size):
+            orders.append(SimpleNamespace(order_id=len(orders), stratum=stratum))
+    return orders
+
+
+def sample(sizes, sample_size):
+    return StratifiedSample(
+        population(sizes), sample_size, key=lambda order: order.stratum, seed=1
+    )
+
+
+def test_sample_has_requested_size():
+    assert sample([50] + [3] * 50, 30).size == 30
+
+
+def test_pooled_stratum_has_minimum_sample():
+    result = sample([500, 300, 5, 4], 20)
+    assert result.size == 20
+    assert len(result.samples[StratifiedSample.POOLED]) == 2
+    assert all(len(orders) >= 2 for orders in result.samples.values())
+
+
+def test_small_sample_pools_every_stratum():
+    result = sample([10] * 20, 20)
+    assert list(result.strata) == [StratifiedSample.POOLED]
+    assert result.size == 20
+
+
+def test_sample_is_repeatable_with_seed():
+    first = [order.order_id for order in sample([40, 30, 3], 10).orders]
+    second = [order.order_id for order in sample([40, 30, 3], 10).orders]
+    assert first == second